@@ -0,0 +1,185 @@
+import io
+import wave
+import struct
+import logging
+import numpy as np
+
+TARGET_SAMPLE_RATE = 16000
+
+# Voice activity trimming: frames quieter than both thresholds count as silence
+FRAME_SECONDS = 0.02
+RELATIVE_THRESHOLD_DB = -35.0
+ABSOLUTE_THRESHOLD_DB = -50.0
+# Audio kept on each side of the detected speech so word edges aren't clipped
+PADDING_SECONDS = 0.2
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def parse_wav(data):
+    """
+    Decode a RIFF/WAVE file into float samples.
+
+    Args:
+        data: The file contents
+
+    Returns:
+        tuple or None: (samples as a float32 array of shape (frames, channels) in [-1, 1],
+        sample rate), or None if the data isn't a PCM or float WAV file
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+
+    fmt = None
+    payload = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = data[position:position + 4]
+        chunk_size = struct.unpack_from("<I", data, position + 4)[0]
+        body = data[position + 8:position + 8 + chunk_size]
+        if chunk_id == b"fmt " and len(body) >= 16:
+            fmt = struct.unpack_from("<HHIIHH", body)
+            if fmt[0] == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # The real format is the first two bytes of the sub-format GUID
+                fmt = (struct.unpack_from("<H", body, 24)[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            # Streamed recordings may leave the size unset; take what is there
+            payload = body
+            break
+        position += 8 + chunk_size + (chunk_size & 1)
+
+    if fmt is None or payload is None:
+        return None
+    audio_format, channels, sample_rate, _, _, bits = fmt
+    if channels < 1 or sample_rate < 1:
+        return None
+
+    width = bits // 8
+    usable = len(payload) - len(payload) % (width * channels) if width else 0
+    payload = payload[:usable]
+    if audio_format == _WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(payload, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif audio_format == _WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32768.0
+    elif audio_format == _WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        samples = values.astype(np.float32) / float(1 << 23)
+    elif audio_format == _WAVE_FORMAT_PCM and bits == 32:
+        samples = (np.frombuffer(payload, dtype="<i4").astype(np.float64) / float(1 << 31)).astype(np.float32)
+    elif audio_format == _WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(payload, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    else:
+        return None
+
+    return samples.reshape(-1, channels), sample_rate
+
+def encode_wav(samples, sample_rate):
+    """Encode mono float samples as a 16-bit PCM WAV file."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def downmix(samples):
+    """Average all channels into one."""
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+def trim_silence(samples, sample_rate):
+    """
+    Cut leading and trailing silence using per-frame RMS energy.
+    A frame is voiced if it is within RELATIVE_THRESHOLD_DB of the loudest frame
+    and above ABSOLUTE_THRESHOLD_DB. Clips without voiced frames are returned as-is.
+
+    Returns:
+        numpy.ndarray: The trimmed samples
+    """
+    frame_length = max(1, int(sample_rate * FRAME_SECONDS))
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return samples
+
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    threshold = max(rms.max() * 10 ** (RELATIVE_THRESHOLD_DB / 20), 10 ** (ABSOLUTE_THRESHOLD_DB / 20))
+    voiced = np.flatnonzero(rms >= threshold)
+    if voiced.size == 0:
+        return samples
+
+    padding = int(sample_rate * PADDING_SECONDS)
+    start = max(0, voiced[0] * frame_length - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame_length + padding)
+    return samples[start:end]
+
+def resample(samples, sample_rate, target_rate=TARGET_SAMPLE_RATE, taps=63):
+    """
+    Resample mono audio by linear interpolation, low-pass filtering first when
+    downsampling so content above the new Nyquist frequency doesn't alias.
+    """
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+
+    if target_rate < sample_rate:
+        # Windowed-sinc low-pass at the target Nyquist frequency
+        cutoff = target_rate / sample_rate / 2
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        kernel /= kernel.sum()
+        samples = np.convolve(samples, kernel.astype(np.float32), mode="same")
+
+    duration = len(samples) / sample_rate
+    target_length = max(1, int(round(duration * target_rate)))
+    positions = np.arange(target_length) * (sample_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def preprocess_audio(data, target_rate=TARGET_SAMPLE_RATE, trim=True):
+    """
+    Prepare uploaded audio for speech-to-text: mono downmix, silence trimming and
+    resampling, re-encoded as 16-bit PCM WAV. Audio that isn't WAV (e.g. WebM from
+    MediaRecorder) or wouldn't get smaller is returned unchanged.
+
+    Args:
+        data: The uploaded file contents
+        target_rate: Output sample rate
+        trim: Cut leading and trailing silence
+
+    Returns:
+        tuple: (audio bytes, stats dict with original_bytes, processed_bytes,
+        bytes_saved, trimmed_seconds and applied)
+    """
+    stats = {
+        "applied": False,
+        "original_bytes": len(data),
+        "processed_bytes": len(data),
+        "bytes_saved": 0,
+        "trimmed_seconds": 0.0
+    }
+
+    try:
+        decoded = parse_wav(data)
+    except Exception as e:
+        logging.warning(f"Could not decode WAV upload: {str(e)}")
+        decoded = None
+    if decoded is None:
+        return data, stats
+
+    samples, sample_rate = decoded
+    mono = downmix(samples)
+    trimmed = trim_silence(mono, sample_rate) if trim else mono
+    processed = encode_wav(resample(trimmed, sample_rate, target_rate), target_rate)
+    if len(processed) >= len(data):
+        return data, stats
+
+    stats.update(
+        applied=True,
+        processed_bytes=len(processed),
+        bytes_saved=len(data) - len(processed),
+        trimmed_seconds=round((len(mono) - len(trimmed)) / sample_rate, 3)
+    )
+    return processed, stats
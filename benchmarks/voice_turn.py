@@ -0,0 +1,452 @@
+"""
+Offline end-to-end latency benchmark for the voice turn.
+
+Drives /transcribe, the send_message Socket.IO event and /get_chat_history through
+the Flask and Socket.IO test clients, with fake OpenAI, Google TTS and Pinecone
+clients that sleep for configurable latencies. Reports p50/p95/p99 per stage and
+per voice turn, plus throughput at the given number of concurrent users, and writes
+the results as JSON so runs can be compared.
+
+Usage:
+    python benchmarks/voice_turn.py --users 8 --turns 20 --output results.json
+    python benchmarks/voice_turn.py --compare baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import platform
+import tempfile
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a sorted list, or None if it is empty."""
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+class StageRecorder:
+    """Thread-safe latency samples by stage name."""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    def time(self, stage):
+        recorder = self
+
+        class Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                recorder.record(stage, time.perf_counter() - self.start)
+
+        return Timer()
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+    def count(self, stage):
+        with self._lock:
+            return len(self._samples.get(stage, []))
+
+    def summary(self):
+        """Return count, mean, p50, p95, p99 and max in milliseconds per stage."""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        summary = {}
+        for stage, values in sorted(samples.items()):
+            summary[stage] = {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3)
+            }
+        return summary
+
+class Latency:
+    """Configured provider latencies with seeded jitter, so runs are reproducible."""
+
+    def __init__(self, recorder, latencies_ms, jitter, seed):
+        self.recorder = recorder
+        self.latencies_ms = latencies_ms
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, stage):
+        with self._lock:
+            factor = self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        delay = max(0.0, self.latencies_ms[stage] * factor / 1000)
+        with self.recorder.time(stage):
+            time.sleep(delay)
+
+# Fake provider clients, shaped like the parts of the SDK responses the app reads
+
+def _completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class FakeChatCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+        # Replies differ between calls like real ones, so they aren't all served by the TTS cache
+        self._replies = itertools.count(1)
+
+    def _follow_up(self):
+        return f"What time works for you, and is that for option {next(self._replies)}?"
+
+    def create(self, model, messages, stream=False, response_format=None, **kwargs):
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        user_text = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        confirmed = "send it" in user_text.lower()
+
+        if response_format is not None:
+            self.latency.wait("llm")
+            schema = response_format["json_schema"]["schema"]["properties"]["recipient"]
+            contacts = schema["anyOf"][0].get("enum", []) if "anyOf" in schema else []
+            recipient = next((name for name in contacts if name in system + user_text), None)
+            return _completion(json.dumps({
+                "recipient": recipient,
+                "reply": "Got it, your message is ready." if confirmed else self._follow_up(),
+                "ready_to_send": confirmed,
+                "message_body": "lunch is on" if confirmed else None
+            }))
+
+        if system.startswith("Extract the recipient"):
+            self.latency.wait("llm")
+            message, _, contacts = user_text.partition("Available contacts: ")
+            contacts = [name.strip() for name in contacts.split("\n")[0].split(",")]
+            return _completion(next((name for name in contacts if name and name in message), "NONE"))
+
+        if stream:
+            # Time to first token is the configured latency; the rest arrives as chunks
+            self.latency.wait("llm")
+
+            def chunks():
+                for part in self._follow_up().split(" "):
+                    yield _chunk(part + " ")
+            return chunks()
+
+        self.latency.wait("llm")
+        if "Hey [recipient]" in system or "wants to inform u" in system + user_text:
+            return _completion("Hey there!, the sender wants to inform u that lunch is on")
+        if system.startswith("Summarize"):
+            return _completion("The user is arranging lunch.")
+        return _completion(self._follow_up())
+
+class FakeTranscriptions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, model, file, **kwargs):
+        # The benchmark uploads the words to "hear" as the audio bytes
+        _, audio = file
+        data = audio.read() if hasattr(audio, "read") else audio
+        self.latency.wait("stt")
+        return SimpleNamespace(text=bytes(data).decode("utf-8", errors="ignore"))
+
+class FakeEmbeddings:
+    def __init__(self, latency, dimension):
+        self.latency = latency
+        self.dimension = dimension
+
+    def create(self, model, input):
+        self.latency.wait("embedding")
+        data = []
+        for index, text in enumerate(input):
+            seeded = random.Random(text)
+            data.append(SimpleNamespace(index=index, embedding=[seeded.random() for _ in range(self.dimension)]))
+        return SimpleNamespace(data=data)
+
+class FakeOpenAI:
+    def __init__(self, latency, dimension):
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(latency))
+        self.audio = SimpleNamespace(transcriptions=FakeTranscriptions(latency))
+        self.embeddings = FakeEmbeddings(latency, dimension)
+
+class FakeTTS:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def synthesize_speech(self, input, voice, audio_config, timeout=None):
+        self.latency.wait("tts")
+        return SimpleNamespace(audio_content=b"ID3" + input.text.encode("utf-8"))
+
+class FakePineconeIndex:
+    """Pinecone index over an in-process store, with the configured round-trip latency."""
+
+    def __init__(self, latency, store):
+        self.latency = latency
+        self.store = store
+
+    def upsert(self, vectors):
+        self.latency.wait("vector_upsert")
+        self.store.upsert(vectors)
+
+    def query(self, vector, top_k, include_metadata=True, filter=None):
+        self.latency.wait("vector_query")
+        matches = self.store.query(vector, top_k, filter=filter)
+        return SimpleNamespace(matches=[
+            SimpleNamespace(id=match["id"], score=match["score"], metadata=match["metadata"])
+            for match in matches
+        ])
+
+    def fetch(self, ids):
+        self.latency.wait("vector_fetch")
+        return SimpleNamespace(vectors={
+            vector_id: SimpleNamespace(metadata=metadata)
+            for vector_id, metadata in self.store.fetch(ids).items()
+        })
+
+    def list(self, prefix=None, limit=100):
+        self.latency.wait("vector_list")
+        return self.store.list_ids(prefix=prefix, batch_size=limit)
+
+    def update(self, id, set_metadata):
+        self.latency.wait("vector_upsert")
+        self.store.update_metadata(id, set_metadata)
+
+class FakeIndexList(list):
+    def names(self):
+        return list(self)
+
+class FakePinecone:
+    def __init__(self, latency, store):
+        self._index = FakePineconeIndex(latency, store)
+
+    def list_indexes(self):
+        return FakeIndexList(["conversation-contexts"])
+
+    def Index(self, name):
+        return self._index
+
+def install_fakes(latency):
+    """Point the app at fake providers. Must run before the app modules are imported."""
+    import provider_clients
+    from vector_store import NumpyVectorStore, EMBEDDING_DIMENSION
+
+    provider_clients.set_client("openai", FakeOpenAI(latency, EMBEDDING_DIMENSION))
+    provider_clients.set_client("tts", FakeTTS(latency))
+    provider_clients.set_client("pinecone", FakePinecone(latency, NumpyVectorStore(EMBEDDING_DIMENSION)))
+
+# Benchmark driver
+
+MAX_TURNS = 5
+
+def run_user(appmod, recorder, user, recipient, warmup, turns, barrier, errors):
+    """
+    Run voice turns for one user on its own test clients: the warm-up turns, then
+    (once every user has warmed up) the measured ones. A voice turn is the recording,
+    confirmations until the message is final, sending it and reloading the chat.
+    """
+    client = appmod.app.test_client()
+    socket = appmod.socketio.test_client(appmod.app, flask_test_client=client)
+    socket.emit("join", {"username": user})
+    socket.get_received()
+    headers = {"X-Username": user}
+
+    def post_audio(words, is_continuing):
+        response = client.post("/transcribe", headers=headers, data={
+            "file": (io.BytesIO(words.encode("utf-8")), "recording.wav"),
+            "is_continuing": "true" if is_continuing else "false"
+        })
+        if response.status_code != 200:
+            errors.append(f"/transcribe {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            return None
+        return response.get_json()
+
+    def voice_turn(iteration):
+        turn_start = time.perf_counter()
+        with recorder.time("transcribe"):
+            result = post_audio(f"Tell {recipient} that lunch moved to {iteration % 12 + 1} pm, take {iteration}", False)
+        turns = 1
+        while result is not None and not result.get("is_final") and turns < MAX_TURNS:
+            with recorder.time("transcribe"):
+                result = post_audio("That's all, send it", True)
+            turns += 1
+        if result is None:
+            return
+
+        with recorder.time("send_message"):
+            socket.emit("send_message", {
+                "sender": user,
+                "receiver": result.get("detected_receiver") or recipient,
+                "message": result.get("final_message") or result.get("transcript", ""),
+                "is_voice_message": True
+            })
+
+        with recorder.time("get_chat_history"):
+            response = client.post("/get_chat_history", json={"user1": user, "user2": recipient})
+        if response.status_code != 200:
+            errors.append(f"/get_chat_history {response.status_code}")
+            return
+
+        recorder.record("voice_turn", time.perf_counter() - turn_start)
+        socket.get_received()
+
+    for iteration in range(warmup):
+        voice_turn(iteration)
+    # Samples recorded so far are dropped once every user reaches the barrier
+    barrier.wait()
+    for iteration in range(warmup, warmup + turns):
+        voice_turn(iteration)
+    socket.disconnect()
+
+def run_benchmark(args):
+    started_at = datetime.now(timezone.utc).isoformat()
+    recorder = StageRecorder()
+    latency = Latency(recorder, {
+        "stt": args.stt_ms,
+        "llm": args.llm_ms,
+        "tts": args.tts_ms,
+        "embedding": args.embedding_ms,
+        "vector_query": args.vector_ms,
+        "vector_upsert": args.vector_ms,
+        "vector_fetch": args.vector_ms,
+        "vector_list": args.vector_ms
+    }, args.jitter, args.seed)
+
+    # Offline configuration; settings already in the environment (or .env) still apply
+    database_dir = tempfile.mkdtemp(prefix="voice-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(database_dir, 'bench.db')}")
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ.setdefault("VECTOR_STORE", "pinecone")
+    os.environ.setdefault("STT_PROVIDERS", "whisper")
+    os.environ.setdefault("LIVE_STT_BACKEND", "fake")
+    # Users run on OS threads, so Socket.IO runs in threading mode rather than on eventlet
+    os.environ.setdefault("SOCKETIO_ASYNC_MODE", "threading")
+    install_fakes(latency)
+
+    import logging
+    import app as appmod
+    from openai_api import llm_cache
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    users = [f"bench_user_{i}" for i in range(args.users)]
+    errors = []
+    started = {}
+
+    def start_measuring():
+        recorder.reset()
+        started["at"] = time.perf_counter()
+
+    barrier = threading.Barrier(args.users, action=start_measuring)
+    threads = [
+        threading.Thread(
+            target=run_user,
+            args=(appmod, recorder, user, users[(i + 1) % len(users)], args.warmup, args.turns, barrier, errors),
+            name=user
+        )
+        for i, user in enumerate(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started.get("at", time.perf_counter())
+
+    appmod.context_writer.flush(timeout=10)
+    voice_turns = recorder.count("voice_turn")
+    requests = sum(recorder.count(stage) for stage in ("transcribe", "send_message", "get_chat_history"))
+
+    return {
+        "benchmark": "voice_turn",
+        "started_at": started_at,
+        "config": {
+            "users": args.users,
+            "turns": args.turns,
+            "warmup": args.warmup,
+            "latency_ms": latency.latencies_ms,
+            "jitter": args.jitter,
+            "seed": args.seed,
+            "structured_turns": appmod.STRUCTURED_TURNS,
+            "pipelined_transcription": os.getenv("PIPELINED_TRANSCRIPTION", "true")
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "duration_seconds": round(duration, 3),
+        "throughput": {
+            "voice_turns_per_second": round(voice_turns / duration, 3) if duration else None,
+            "requests_per_second": round(requests / duration, 3) if duration else None
+        },
+        "errors": len(errors),
+        "error_samples": errors[:10],
+        "stages": recorder.summary(),
+        "app_stats": {
+            "llm_cache": llm_cache.stats(),
+            "stt_router": appmod.stt_router.stats(),
+            "context_writer": appmod.context_writer.stats()
+        }
+    }
+
+def print_report(results, baseline=None):
+    print(f"{results['config']['users']} users x {results['config']['turns']} voice turns "
+          f"in {results['duration_seconds']}s, "
+          f"{results['throughput']['voice_turns_per_second']} turns/s, "
+          f"{results['throughput']['requests_per_second']} requests/s, {results['errors']} errors")
+    header = f"{'stage':<18}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}"
+    if baseline:
+        header += f"{'p50 delta':>12}{'p95 delta':>12}{'p99 delta':>12}"
+    print(header)
+    for stage, stats in results["stages"].items():
+        line = f"{stage:<18}{stats['count']:>7}{stats['p50_ms']:>11.1f}{stats['p95_ms']:>11.1f}{stats['p99_ms']:>11.1f}"
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous:
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                line += f"{stats[key] - previous[key]:>+12.1f}"
+        print(line)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark for the voice turn.")
+    parser.add_argument("--users", type=int, default=4, help="concurrent users")
+    parser.add_argument("--turns", type=int, default=10, help="measured voice turns per user")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured voice turns per user")
+    parser.add_argument("--stt-ms", type=float, default=300, help="fake Whisper latency")
+    parser.add_argument("--llm-ms", type=float, default=400, help="fake chat completion latency")
+    parser.add_argument("--tts-ms", type=float, default=150, help="fake Google TTS latency")
+    parser.add_argument("--embedding-ms", type=float, default=80, help="fake embeddings latency")
+    parser.add_argument("--vector-ms", type=float, default=40, help="fake Pinecone round-trip latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative +/- jitter on every latency")
+    parser.add_argument("--seed", type=int, default=1, help="jitter seed")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results file to print deltas against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run_benchmark(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print_report(results, baseline)
+    print(f"Results written to {args.output}")
+    return 1 if results["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+import re
+import logging
+import threading
+
+# Separators treated as spaces so "john_doe" matches a transcribed "John Doe"
+_SEPARATORS = re.compile(r"[\s_\-.]+")
+
+# Common patterns for detecting recipients in relay messages, in priority order
+RECIPIENT_PATTERNS = [
+    r"tell\s+(\w+)",
+    r"ask\s+(\w+)",
+    r"let\s+(\w+)\s+know",
+    r"inform\s+(\w+)",
+    r"message\s+(\w+)",
+    r"send\s+to\s+(\w+)",
+    r"contact\s+(\w+)",
+    r"check\s+with\s+(\w+)",
+    r"relay\s+to\s+(\w+)",
+    r"forward\s+to\s+(\w+)",
+    r"pass\s+to\s+(\w+)",
+    r"communicate\s+to\s+(\w+)",
+    r"for\s+(\w+)[\s:,]"
+]
+
+# All patterns in one regex; the lookahead lets overlapping matches through
+# and each pattern's capture is a named group c<priority>
+_NAME_GROUP = r"(\w+)"
+RECIPIENT_PATTERN = re.compile(
+    "(?=" + "|".join(
+        "(?:" + pattern.replace(_NAME_GROUP, f"(?P<c{i}>\\w+)", 1) + ")"
+        for i, pattern in enumerate(RECIPIENT_PATTERNS)
+    ) + ")"
+)
+
+def normalize_name(name):
+    """Lowercase a name and collapse separators to single spaces."""
+    return _SEPARATORS.sub(" ", name.lower()).strip()
+
+def default_max_distance(name):
+    """Edit distance tolerated for a name of this length when fuzzy matching."""
+    if len(name) <= 3:
+        return 0
+    if len(name) <= 6:
+        return 1
+    return 2
+
+class _TrieNode:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children = {}
+        self.names = []
+
+class ContactIndex:
+    """
+    Index of contact names for recipient detection.
+    Names are kept in a normalized hash map for exact lookups and in a trie over
+    their normalized characters, which finds multi-word names in a transcript and
+    supports fuzzy matching within an edit distance for STT misspellings.
+    """
+
+    def __init__(self, names=(), load_names=None):
+        """
+        Args:
+            names: Initial contact names
+            load_names: Optional callable returning the names, called on first use
+        """
+        self._load_names = load_names
+        self._loaded = load_names is None
+        self._names = {}
+        self._by_key = {}
+        self._root = _TrieNode()
+        self._lock = threading.RLock()
+        for name in names:
+            self.add(name)
+
+    def ensure_loaded(self):
+        """Load the names from load_names now if that hasn't happened yet."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                for name in self._load_names():
+                    self._add(name)
+                self._loaded = True
+            except Exception as e:
+                logging.error(f"Error loading contacts: {str(e)}")
+
+    def add(self, name):
+        """Add a contact name to the index."""
+        with self._lock:
+            self._add(name)
+
+    def _add(self, name):
+        key = normalize_name(name)
+        if not key or name in self._names:
+            return
+        self._names[name] = key
+        self._by_key.setdefault(key, []).append(name)
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+        node.names.append(name)
+
+    def remove(self, name):
+        """Remove a contact name from the index."""
+        with self._lock:
+            key = self._names.pop(name, None)
+            if key is None:
+                return
+            self._by_key[key].remove(name)
+            if not self._by_key[key]:
+                del self._by_key[key]
+            node = self._root
+            for char in key:
+                node = node.children[char]
+            node.names.remove(name)
+
+    def invalidate(self):
+        """Drop every name so they are loaded again from load_names on next use."""
+        if self._load_names is None:
+            return
+        with self._lock:
+            self._names = {}
+            self._by_key = {}
+            self._root = _TrieNode()
+            self._loaded = False
+
+    def __contains__(self, name):
+        self.ensure_loaded()
+        return name in self._names
+
+    def __iter__(self):
+        self.ensure_loaded()
+        return iter(list(self._names))
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self._names)
+
+    def excluding(self, name):
+        """Return a view of the index without one name, e.g. the user doing the lookup."""
+        return ContactView(self, name)
+
+    def lookup(self, name, exclude=None):
+        """
+        Exact match after normalization.
+
+        Returns:
+            str or None: The contact name as registered, or None
+        """
+        self.ensure_loaded()
+        if not name:
+            return None
+        for contact in self._by_key.get(normalize_name(name), ()):
+            if contact != exclude:
+                return contact
+        return None
+
+    def fuzzy_lookup(self, name, max_distance=None, exclude=None):
+        """
+        Find the closest contact within an edit distance.
+
+        Args:
+            name: The name to match
+            max_distance: Maximum edit distance (defaults by name length)
+            exclude: A contact name to ignore
+
+        Returns:
+            str or None: The unique closest contact, or None if there is none or it's a tie
+        """
+        self.ensure_loaded()
+        word = normalize_name(name or "")
+        if not word:
+            return None
+        if max_distance is None:
+            max_distance = default_max_distance(word)
+
+        best_distance = None
+        best = []
+        first_row = list(range(len(word) + 1))
+        stack = [(child, char, first_row) for char, child in self._root.children.items()]
+        while stack:
+            node, char, previous_row = stack.pop()
+            # One row of the Levenshtein table for this trie prefix
+            row = [previous_row[0] + 1]
+            for i in range(1, len(word) + 1):
+                row.append(min(
+                    row[i - 1] + 1,
+                    previous_row[i] + 1,
+                    previous_row[i - 1] + (word[i - 1] != char)
+                ))
+            candidates = [contact for contact in node.names if contact != exclude]
+            if candidates and row[-1] <= max_distance:
+                if best_distance is None or row[-1] < best_distance:
+                    best_distance, best = row[-1], candidates
+                elif row[-1] == best_distance:
+                    best = best + candidates
+            if min(row) <= max_distance:
+                stack.extend((child, next_char, row) for next_char, child in node.children.items())
+
+        return best[0] if len(best) == 1 else None
+
+    def match(self, name, fuzzy=True, exclude=None):
+        """Exact lookup, falling back to a fuzzy match."""
+        contact = self.lookup(name, exclude=exclude)
+        if contact is None and fuzzy:
+            contact = self.fuzzy_lookup(name, exclude=exclude)
+        return contact
+
+    def _longest_name_at(self, text, start, exclude=None):
+        # Walk the trie along the text and keep the last name ending on a word boundary
+        node = self._root
+        found = None
+        for position in range(start, len(text)):
+            node = node.children.get(text[position])
+            if node is None:
+                break
+            end = position + 1
+            if end == len(text) or not text[end].isalnum():
+                candidates = [contact for contact in node.names if contact != exclude]
+                if candidates:
+                    found = candidates[0]
+        return found
+
+    def find_recipient(self, transcript, fuzzy=True, exclude=None):
+        """
+        Detect a recipient from relay phrases such as "tell Alice" or "let Bob know".
+
+        Args:
+            transcript: The transcribed text
+            fuzzy: Accept near-misses within the default edit distance
+            exclude: A contact name to ignore (usually the sender)
+
+        Returns:
+            str or None: The detected contact name, or None
+        """
+        self.ensure_loaded()
+        if not transcript:
+            return None
+        text = normalize_name(transcript)
+
+        candidates = []
+        for found in RECIPIENT_PATTERN.finditer(text):
+            for group, value in found.groupdict().items():
+                if value is not None:
+                    candidates.append((int(group[1:]), found.start(group), value))
+        candidates.sort()
+
+        # Exact (possibly multi-word) names first, then fuzzy matches, both by pattern priority
+        for _, start, _ in candidates:
+            contact = self._longest_name_at(text, start, exclude=exclude)
+            if contact:
+                return contact
+        if fuzzy:
+            for _, _, value in candidates:
+                contact = self.fuzzy_lookup(value, exclude=exclude)
+                if contact:
+                    return contact
+        return None
+
+    def detect(self, transcript, exclude=None):
+        """
+        Deterministic recipient detection with a confidence score.
+        A relay phrase naming exactly one contact ("tell Alice ...") scores highest;
+        competing mentions, bare mentions and fuzzy matches score lower.
+
+        Returns:
+            tuple: (contact name or None, confidence between 0 and 1)
+        """
+        mentioned = self.mentions(transcript, exclude=exclude)
+        exact = self.find_recipient(transcript, fuzzy=False, exclude=exclude)
+        if exact:
+            others = [contact for contact in mentioned if contact != exact]
+            return exact, (0.6 if others else 0.95)
+        if len(mentioned) == 1:
+            return mentioned[0], 0.7
+        fuzzy = self.find_recipient(transcript, fuzzy=True, exclude=exclude)
+        if fuzzy:
+            return fuzzy, 0.5
+        return None, 0.0
+
+    def mentions(self, transcript, exclude=None):
+        """
+        List every contact whose full name appears as words in the transcript.
+
+        Returns:
+            list: Contact names in order of first appearance
+        """
+        self.ensure_loaded()
+        text = normalize_name(transcript or "")
+        found = []
+        for position in range(len(text)):
+            if position and text[position - 1].isalnum():
+                continue
+            contact = self._longest_name_at(text, position, exclude=exclude)
+            if contact and contact not in found:
+                found.append(contact)
+        return found
+
+class ContactView:
+    """A ContactIndex seen from one user's side, leaving out that user."""
+
+    def __init__(self, index, excluded):
+        self.index = index
+        self.excluded = excluded
+
+    def __contains__(self, name):
+        return name != self.excluded and name in self.index
+
+    def __iter__(self):
+        return (name for name in self.index if name != self.excluded)
+
+    def __len__(self):
+        return len(self.index) - (1 if self.excluded in self.index else 0)
+
+    def lookup(self, name):
+        return self.index.lookup(name, exclude=self.excluded)
+
+    def fuzzy_lookup(self, name, max_distance=None):
+        return self.index.fuzzy_lookup(name, max_distance=max_distance, exclude=self.excluded)
+
+    def match(self, name, fuzzy=True):
+        return self.index.match(name, fuzzy=fuzzy, exclude=self.excluded)
+
+    def find_recipient(self, transcript, fuzzy=True):
+        return self.index.find_recipient(transcript, fuzzy=fuzzy, exclude=self.excluded)
+
+    def detect(self, transcript):
+        return self.index.detect(transcript, exclude=self.excluded)
+
+    def mentions(self, transcript):
+        return self.index.mentions(transcript, exclude=self.excluded)
+
+def as_contact_index(contacts):
+    """Accept a ContactIndex, a ContactView or a plain list of names."""
+    if isinstance(contacts, (ContactIndex, ContactView)):
+        return contacts
+    return ContactIndex(contacts or ())
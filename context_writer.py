@@ -0,0 +1,181 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from pinecone_database import append_conversation_messages
+
+class ContextWriteBehind:
+    """
+    Background writer for conversation context updates.
+    Messages are queued from the Socket.IO handlers and flushed by a worker thread,
+    which coalesces pending messages per conversation into one embedding and
+    batches the upserts across conversations. Submitting never blocks or touches
+    the vector store: when the queue is full, messages are merged into a per-conversation
+    overflow buffer, and only dropped once that buffer is full too. Messages keep their
+    order: while the overflow holds anything, new messages join it rather than the queue,
+    and it is only written once the queue has drained.
+    """
+
+    def __init__(self, writer=append_conversation_messages, max_queue_size=1000, max_batch_size=100,
+                 max_retries=3, retry_backoff=0.5):
+        """
+        Args:
+            writer: Function taking a list of (conversation_id, messages, participants)
+            max_queue_size: Maximum number of queued messages
+            max_batch_size: Maximum number of messages per flush
+            max_retries: Attempts after the first failure before a batch is dropped
+            retry_backoff: Initial retry delay in seconds, doubled on each attempt
+        """
+        self.writer = writer
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # conversation_id -> (messages, participants), filled while the queue is full
+        self._overflow = OrderedDict()
+        self._max_overflow = max_queue_size
+        # Overflow messages not yet written, including those in the worker's current batch
+        self._overflow_pending = 0
+        self._overflow_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._counters = {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "retries": 0,
+            "dropped": 0,
+            "overflowed": 0,
+            "overflow_dropped": 0
+        }
+
+    def submit(self, conversation_id, message, participants):
+        """
+        Queue a message for the conversation's context.
+        When the queue is full, or earlier messages are already waiting in the overflow,
+        the message joins the conversation's overflow entry, written once the queue has
+        drained. Once the overflow holds as many messages as the queue, further messages
+        are dropped and counted.
+
+        Args:
+            conversation_id: The unique conversation identifier
+            message: The formatted message to append
+            participants: List of participants in the conversation
+        """
+        self._ensure_worker()
+        with self._overflow_lock:
+            outcome = "overflowed"
+            if not self._overflow:
+                try:
+                    self._queue.put_nowait((conversation_id, message, participants))
+                    outcome = "enqueued"
+                except queue.Full:
+                    pass
+            if outcome == "overflowed":
+                if self._overflow_pending >= self._max_overflow:
+                    outcome = "overflow_dropped"
+                else:
+                    entry = self._overflow.setdefault(conversation_id, ([], participants))
+                    entry[0].append(message)
+                    self._overflow_pending += 1
+        if outcome == "overflow_dropped":
+            logging.warning(f"Context queue and overflow full, dropping update for {conversation_id}")
+        self._count(outcome)
+
+    def flush(self, timeout=None):
+        """Block until every queued message has been written or dropped."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks or self._overflow_pending:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        """Return queue depth and write counters."""
+        with self._stats_lock:
+            stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        with self._overflow_lock:
+            stats["overflow_depth"] = self._overflow_pending
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._counters[name] += amount
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="context-writer", daemon=True)
+                self._worker.start()
+
+    def _take_overflow(self):
+        # Overflow is newer than anything queued, so it waits until the queue is empty;
+        # submit doesn't queue while the overflow holds messages, so the check holds
+        with self._overflow_lock:
+            if not self._overflow or not self._queue.empty():
+                return []
+            overflow, self._overflow = self._overflow, OrderedDict()
+        return [
+            (conversation_id, message, participants)
+            for conversation_id, (messages, participants) in overflow.items()
+            for message in messages
+        ]
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                # Wake up now and then for overflow that arrived after the queue drained
+                batch.append(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                pass
+            while batch and len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            queued = len(batch)
+            overflow = self._take_overflow()
+            batch.extend(overflow)
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            finally:
+                for _ in range(queued):
+                    self._queue.task_done()
+                with self._overflow_lock:
+                    self._overflow_pending -= len(overflow)
+
+    def _write(self, items):
+        # Coalesce messages per conversation, keeping their order
+        grouped = OrderedDict()
+        for conversation_id, message, participants in items:
+            entry = grouped.setdefault(conversation_id, (conversation_id, [], participants))
+            entry[1].append(message)
+        updates = list(grouped.values())
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.writer(updates)
+                self._count("flushes")
+                self._count("written", len(items))
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logging.error(f"Dropping {len(items)} context update(s) after {attempt + 1} attempts: {str(e)}")
+                    self._count("dropped", len(items))
+                    return False
+                delay = self.retry_backoff * (2 ** attempt)
+                logging.warning(f"Context update failed, retrying in {delay:.1f}s: {str(e)}")
+                self._count("retries")
+                time.sleep(delay)
+
+# Shared writer used by the Socket.IO message handler
+context_writer = ContextWriteBehind(max_queue_size=int(os.getenv("CONTEXT_QUEUE_SIZE", "1000")))
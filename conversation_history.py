@@ -0,0 +1,143 @@
+import os
+import logging
+
+# Prompt budget for the conversation history (summary plus recent messages)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Once over budget, fold down to this share of it so the summary isn't redone every turn
+HISTORY_LOW_WATER = 0.6
+# Upper bound on the running summary
+SUMMARY_MAX_TOKENS = 200
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logging.info(f"tiktoken unavailable, estimating token counts: {str(e)}")
+    return _encoding
+
+def count_tokens(text):
+    """Count tokens with tiktoken when installed, otherwise estimate about four characters per token."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_text(text, max_tokens):
+    """Cut text to its first max_tokens tokens, marking the cut with an ellipsis."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_tokens = max(max_tokens - 1, 0)
+    encoding = _get_encoding()
+    if encoding is not None:
+        kept = encoding.decode(encoding.encode(text)[:max_tokens])
+    else:
+        kept = text[:max_tokens * 4]
+    return kept.rstrip() + "…"
+
+def message_tokens(message):
+    """Token count of a history message, computed once and kept on the message."""
+    if "tokens" not in message:
+        message["tokens"] = count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+    return message["tokens"]
+
+def append_message(conversation, role, content):
+    """Add a message to a conversation's history with its token count."""
+    conversation["history"].append({
+        "role": role,
+        "content": content,
+        "tokens": count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    })
+
+def history_tokens(conversation):
+    """Tokens used by the summary and every message in the history."""
+    return conversation.get("summary_tokens", 0) + sum(
+        message_tokens(message) for message in conversation["history"]
+    )
+
+def compact_history(conversation, summarize, budget=None):
+    """
+    Fold the oldest messages into the running summary when the history is over budget,
+    down to HISTORY_LOW_WATER of the budget. The latest message is kept, and only
+    truncated if it doesn't fit in the budget on its own, so the budget is a hard bound.
+    The summary is kept in the conversation state, so it is only recomputed when
+    more messages are folded into it.
+
+    Args:
+        conversation: The conversation state dict
+        summarize: Function (previous summary or None, list of messages) returning the new summary
+        budget: Token budget (defaults to HISTORY_TOKEN_BUDGET)
+
+    Returns:
+        bool: True if messages were folded or truncated
+    """
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+
+    history = conversation["history"]
+    total = history_tokens(conversation)
+    if total <= budget:
+        return False
+
+    folded = []
+    target = budget * HISTORY_LOW_WATER
+    while total > target and len(history) > 1:
+        message = history.pop(0)
+        total -= message_tokens(message)
+        folded.append(message)
+    if folded:
+        _fold_into_summary(conversation, folded, summarize)
+
+    truncated = False
+    latest = history[-1] if history else None
+    if latest is not None and history_tokens(conversation) > budget:
+        room = budget - conversation.get("summary_tokens", 0) - MESSAGE_OVERHEAD_TOKENS
+        latest["content"] = truncate_text(latest["content"], max(room, 0))
+        latest["tokens"] = count_tokens(latest["content"]) + MESSAGE_OVERHEAD_TOKENS
+        truncated = True
+        logging.info("Truncated a conversation message longer than the history budget")
+    return bool(folded) or truncated
+
+def _fold_into_summary(conversation, folded, summarize):
+    previous = conversation.get("summary")
+    try:
+        summary = summarize(previous, folded)
+    except Exception as e:
+        logging.error(f"Error summarizing conversation history: {str(e)}")
+        summary = None
+    if not summary:
+        # Keep the user's words, newest last, cut to the summary bound
+        text = " ".join([previous or ""] + [m["content"] for m in folded if m["role"] == "user"]).strip()
+        summary = text[-SUMMARY_MAX_TOKENS * 4:]
+
+    conversation["summary"] = summary
+    conversation["summary_tokens"] = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+    logging.info(f"Folded {len(folded)} messages into the conversation summary")
+
+def prompt_messages(conversation):
+    """
+    Return the history as chat messages for the model: the running summary
+    (if any) as a system message followed by the recent messages.
+    """
+    messages = []
+    if conversation.get("summary"):
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {conversation['summary']}"
+        })
+    messages.extend(
+        {"role": message["role"], "content": message["content"]}
+        for message in conversation["history"]
+    )
+    return messages
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from kv_store import create_kv_client
+
+class ConversationStore:
+    """
+    Storage for per-user voice conversation state.
+    Values are plain JSON-serializable dicts. get returns a copy the caller may
+    modify; changes are only kept once they are written back with put.
+    """
+
+    def get(self, key):
+        """Return the stored conversation, or None if it is missing or expired."""
+        raise NotImplementedError
+
+    def put(self, key, value):
+        """Store a conversation, resetting its time-to-live."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove a conversation if present."""
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def stats(self):
+        """Return usage counters, plus the size where it is cheap to get."""
+        raise NotImplementedError
+
+class MemoryConversationStore(ConversationStore):
+    """In-process store bounded by entry count (LRU) and time-to-live."""
+
+    def __init__(self, max_entries=10000, ttl=1800, clock=time.monotonic):
+        """
+        Args:
+            max_entries: Maximum number of conversations kept
+            ttl: Seconds of inactivity before a conversation expires
+            clock: Time source, replaceable in tests
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return json.loads(value)
+
+    def put(self, key, value):
+        # Stored serialized so callers can't mutate shared state by accident
+        serialized = json.dumps(value)
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, serialized)
+            self._entries.move_to_end(key)
+            self._expire()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _expire(self):
+        # Caller holds the lock; drop expired entries from the least recently used end
+        now = self._clock()
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+            self._counters["expirations"] += 1
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return dict(self._counters, size=len(self._entries), max_entries=self.max_entries)
+
+class KeyValueConversationStore(ConversationStore):
+    """
+    Store backed by a shared key-value server (Redis or compatible), so every
+    worker process sees the same conversations. Expiry is left to the server, and
+    stats() reports this worker's counters only: counting the stored conversations
+    would need a scan of the whole keyspace on every scrape.
+    """
+
+    def __init__(self, client, ttl=1800, prefix="conversation:"):
+        """
+        Args:
+            client: Object with get, set(name, value, ex=...) and delete, e.g. redis.Redis
+            ttl: Seconds of inactivity before a conversation expires
+            prefix: Key prefix for conversation entries
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(value)
+
+    def put(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        self._count("writes")
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+def create_conversation_store(backend=None):
+    """
+    Create the conversation store selected by the CONVERSATION_STORE environment variable.
+
+    Args:
+        backend: "memory" (default), "redis" (uses REDIS_URL) or "local-kv"; overrides CONVERSATION_STORE
+
+    Returns:
+        ConversationStore: The configured store
+    """
+    backend = (backend or os.getenv("CONVERSATION_STORE", "memory")).lower()
+    ttl = int(os.getenv("CONVERSATION_TTL", "1800"))
+    if backend == "memory":
+        return MemoryConversationStore(
+            max_entries=int(os.getenv("CONVERSATION_MAX_ENTRIES", "10000")),
+            ttl=ttl
+        )
+    if backend == "redis":
+        return KeyValueConversationStore(create_kv_client(), ttl=ttl)
+    if backend == "local-kv":
+        return KeyValueConversationStore(create_kv_client("local://"), ttl=ttl)
+    raise ValueError(f"Unknown conversation store backend: {backend}")
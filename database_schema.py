@@ -50,6 +50,8 @@ class Message(db.Model):
 
 # Create indexes for performance
 Index('idx_message_participants', Message.sender_id, Message.receiver_id)
+# Matches the chat history query: one range scan per direction, already in id order
+Index('idx_message_conversation', Message.sender, Message.receiver, Message.id)
 Index('idx_message_timestamp', Message.timestamp)
 Index('idx_username', User.username)
 
@@ -121,6 +123,7 @@ def initialize_raw_database(dbname='voice_agent', user='postgres', password='200
     
     # Create indexes
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_participants ON messages(sender_id, receiver_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_conversation ON messages(sender, receiver, id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_timestamp ON messages(timestamp)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_username ON users(username)")
     
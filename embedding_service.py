@@ -0,0 +1,156 @@
+import queue
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from provider_clients import get_openai_client, wait
+from metrics import metrics
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+class EmbeddingService:
+    """
+    Shared embedding client for the app.
+    Keeps one OpenAI client alive, coalesces concurrent requests into batched
+    embeddings.create calls and memoizes results in a bounded LRU.
+    """
+
+    def __init__(self, client=None, model=EMBEDDING_MODEL, batch_window=0.01, max_batch_size=64, cache_size=2048):
+        """
+        Args:
+            client: OpenAI client to use (defaults to the shared one)
+            model: Embedding model name
+            batch_window: Seconds to wait for more requests before sending a batch
+            max_batch_size: Maximum number of inputs per embeddings.create call
+            cache_size: Maximum number of memoized embeddings
+        """
+        self.client = client or get_openai_client()
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed(self, text):
+        """
+        Get the embedding for a single text.
+
+        Args:
+            text: The text to embed
+
+        Returns:
+            list: The embedding vector
+        """
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts):
+        """
+        Get embeddings for several texts, served from the cache where possible.
+
+        Args:
+            texts: List of texts to embed
+
+        Returns:
+            list: Embedding vectors in the same order as texts
+        """
+        results = [None] * len(texts)
+        pending = []
+
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                key = self._key(text)
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    results[i] = vector
+                else:
+                    self.misses += 1
+                    pending.append((i, text))
+
+        if pending:
+            self._ensure_worker()
+            futures = []
+            for i, text in pending:
+                future = Future()
+                self._queue.put((text, future))
+                futures.append((i, future))
+            for i, future in futures:
+                results[i] = wait(future)
+
+        return results
+
+    def stats(self):
+        """Return cache and batching counters."""
+        with self._cache_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "batches": self.batches,
+                "cached": len(self._cache),
+                "queued": self._queue.qsize()
+            }
+
+    def _remember(self, text, vector):
+        key = self._key(text)
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Collect whatever else arrives within the batch window
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=self.batch_window))
+                except queue.Empty:
+                    break
+            self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        # Identical texts in one batch share a single input
+        waiters = OrderedDict()
+        for text, future in batch:
+            waiters.setdefault(text, []).append(future)
+        inputs = list(waiters)
+
+        try:
+            with metrics.span("embedding", "openai", "create"):
+                response = self.client.embeddings.create(model=self.model, input=inputs)
+            self.batches += 1
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            logging.error(f"Error creating embeddings: {str(e)}")
+            for futures in waiters.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        for text, vector in zip(inputs, vectors):
+            self._remember(text, vector)
+            for future in waiters[text]:
+                future.set_result(vector)
+
+# Shared service used by the vector store helpers
+embedding_service = EmbeddingService()
@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+
+class LocalKeyValueClient:
+    """
+    In-process stand-in for a Redis client, covering the calls the app uses.
+    Useful for tests and single-process development without a Redis server.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        # Caller holds the lock
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self._clock():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, name):
+        with self._lock:
+            return self._live(name)
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (value, self._clock() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self._live(name) or 0) + amount
+            expires_at = self._data[name][1] if name in self._data else None
+            self._data[name] = (str(value), expires_at)
+            return value
+
+    def decr(self, name, amount=1):
+        return self.incr(name, -amount)
+
+    def expire(self, name, time):
+        with self._lock:
+            value = self._live(name)
+            if value is None:
+                return False
+            self._data[name] = (value, self._clock() + time)
+            return True
+
+    def _sorted_set(self, name):
+        # Caller holds the lock; returns the live member -> score dict, or an empty one
+        value = self._live(name)
+        return value if isinstance(value, dict) else {}
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            members = self._sorted_set(name)
+            added = sum(1 for member in mapping if member not in members)
+            members.update({member: float(score) for member, score in mapping.items()})
+            expires_at = self._data[name][1] if name in self._data else None
+            self._data[name] = (members, expires_at)
+            return added
+
+    def zrem(self, name, *values):
+        with self._lock:
+            members = self._sorted_set(name)
+            return sum(1 for value in values if members.pop(value, None) is not None)
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self._sorted_set(name))
+
+    def zscore(self, name, value):
+        with self._lock:
+            return self._sorted_set(name).get(value)
+
+    def zrangebyscore(self, name, min, max):
+        with self._lock:
+            members = self._sorted_set(name)
+            return sorted(
+                (member for member, score in members.items() if float(min) <= score <= float(max)),
+                key=members.get
+            )
+
+    def zremrangebyscore(self, name, min, max):
+        with self._lock:
+            members = self._sorted_set(name)
+            stale = [member for member, score in members.items() if float(min) <= score <= float(max)]
+            for member in stale:
+                del members[member]
+            return len(stale)
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+def create_kv_client(url=None):
+    """
+    Return a key-value client for the given URL (REDIS_URL by default).
+    "local://" gives a process-wide LocalKeyValueClient, shared by every caller.
+
+    Args:
+        url: Redis URL such as redis://localhost:6379/0, or local://
+
+    Returns:
+        A redis.Redis client or a LocalKeyValueClient
+    """
+    url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    if url.startswith("local://"):
+        with _shared_clients_lock:
+            if url not in _shared_clients:
+                _shared_clients[url] = LocalKeyValueClient()
+            return _shared_clients[url]
+
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
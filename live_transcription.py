@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from provider_clients import get_deepgram_client
+
+class DeepgramLiveTranscriber:
+    """Streams audio chunks to Deepgram's live transcription websocket."""
+
+    def __init__(self, on_transcript, model="nova-2"):
+        """
+        Args:
+            on_transcript: Called with (text, is_final) for each interim or final result
+            model: Deepgram model to use (nova-2 or nova-3)
+        """
+        from deepgram import LiveOptions, LiveTranscriptionEvents
+
+        self.connection = get_deepgram_client().listen.websocket.v("1")
+
+        def handle_transcript(_, result, **kwargs):
+            alternatives = result.channel.alternatives
+            text = alternatives[0].transcript if alternatives else ""
+            on_transcript(text, bool(result.is_final))
+
+        self.connection.on(LiveTranscriptionEvents.Transcript, handle_transcript)
+
+        # Browser recordings are containerized (WebM/Ogg), so Deepgram detects the encoding
+        options = LiveOptions(
+            model=model,
+            language="en-US",
+            smart_format=True,
+            punctuate=True,
+            interim_results=True,
+            endpointing=300
+        )
+        if not self.connection.start(options):
+            raise RuntimeError("Could not start Deepgram live transcription")
+
+    def send(self, chunk):
+        self.connection.send(chunk)
+
+    def finish(self):
+        """Flush buffered audio and close the stream; final results arrive before this returns."""
+        self.connection.finish()
+
+class FakeLiveTranscriber:
+    """
+    Local stand-in for tests and offline runs. Each chunk is UTF-8 text "heard"
+    word by word; sentence-ending punctuation closes a final segment.
+    """
+
+    def __init__(self, on_transcript):
+        self.on_transcript = on_transcript
+        self._words = []
+
+    def send(self, chunk):
+        if isinstance(chunk, (bytes, bytearray)):
+            chunk = bytes(chunk).decode("utf-8", errors="ignore")
+        for word in chunk.split():
+            self._words.append(word)
+            if word[-1] in ".?!":
+                self.on_transcript(" ".join(self._words), True)
+                self._words = []
+            else:
+                self.on_transcript(" ".join(self._words), False)
+
+    def finish(self):
+        if self._words:
+            self.on_transcript(" ".join(self._words), True)
+            self._words = []
+
+def create_live_transcriber(on_transcript, backend=None):
+    """
+    Create the streaming STT backend selected by the LIVE_STT_BACKEND environment variable.
+
+    Args:
+        on_transcript: Called with (text, is_final) for each result
+        backend: "deepgram" (default) or "fake"; overrides LIVE_STT_BACKEND
+    """
+    backend = (backend or os.getenv("LIVE_STT_BACKEND", "deepgram")).lower()
+    if backend == "deepgram":
+        return DeepgramLiveTranscriber(on_transcript)
+    if backend == "fake":
+        return FakeLiveTranscriber(on_transcript)
+    raise ValueError(f"Unknown live transcription backend: {backend}")
+
+class LiveTranscriptionSession:
+    """
+    One streamed utterance. Results from the backend (which may arrive on its own
+    thread) are queued as transcript updates for the Socket.IO relay to emit.
+    """
+
+    def __init__(self, stream_id, username, sid, backend=None):
+        self.stream_id = stream_id
+        self.username = username
+        self.sid = sid
+        self.updates = queue.Queue()
+        self.finished = False
+        self.started_at = self.last_activity = time.monotonic()
+        self._final_segments = []
+        self._lock = threading.Lock()
+        self._finish_lock = threading.Lock()
+        self.transcriber = create_live_transcriber(self._on_transcript, backend)
+
+    def _on_transcript(self, text, is_final):
+        text = text.strip()
+        with self._lock:
+            if is_final and text:
+                self._final_segments.append(text)
+                current = " ".join(self._final_segments)
+            else:
+                current = " ".join(self._final_segments + ([text] if text else []))
+        self.updates.put({"stream_id": self.stream_id, "text": current, "is_final": is_final})
+
+    def send(self, chunk):
+        self.last_activity = time.monotonic()
+        self.transcriber.send(chunk)
+
+    def finish(self):
+        """Close the stream and return the final transcript."""
+        with self._finish_lock:
+            if not self.finished:
+                try:
+                    self.transcriber.finish()
+                finally:
+                    self.finished = True
+        return self.transcript
+
+    def expired(self, idle_timeout, max_duration):
+        """True if no audio arrived for idle_timeout seconds or the stream ran past max_duration."""
+        now = time.monotonic()
+        return now - self.last_activity > idle_timeout or now - self.started_at > max_duration
+
+    @property
+    def transcript(self):
+        with self._lock:
+            return " ".join(self._final_segments)
+
+    def drain(self):
+        """Return every transcript update queued since the last call."""
+        updates = []
+        while True:
+            try:
+                updates.append(self.updates.get_nowait())
+            except queue.Empty:
+                return updates
+
+class LiveTranscriptionSessions:
+    """
+    Active streams by id, plus recently finished transcripts for /transcribe to pick up.
+    Streams left idle or open too long are finished, so abandoned ones don't pile up.
+    """
+
+    def __init__(self, max_finished=1000, idle_timeout=30, max_duration=300):
+        """
+        Args:
+            max_finished: Finished transcripts kept for /transcribe
+            idle_timeout: Seconds without audio before a stream is finished
+            max_duration: Seconds after which a stream is finished regardless of activity
+        """
+        self.max_finished = max_finished
+        self.idle_timeout = idle_timeout
+        self.max_duration = max_duration
+        self._active = {}
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, stream_id, username, sid, backend=None):
+        self.expire()
+        session = LiveTranscriptionSession(stream_id, username, sid, backend)
+        with self._lock:
+            self._active[stream_id] = session
+        return session
+
+    def get(self, stream_id, sid):
+        """Return an active stream, only to the socket that started it."""
+        with self._lock:
+            session = self._active.get(stream_id)
+        return session if session and session.sid == sid else None
+
+    def finish(self, session):
+        """Finish a stream and keep its transcript until take_transcript."""
+        try:
+            transcript = session.finish()
+        finally:
+            with self._lock:
+                self._active.pop(session.stream_id, None)
+        with self._lock:
+            self._finished[session.stream_id] = (session.username, transcript)
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
+        return transcript
+
+    def is_expired(self, session):
+        return session.expired(self.idle_timeout, self.max_duration)
+
+    def expire(self):
+        """Finish every active stream past its idle timeout or maximum duration."""
+        with self._lock:
+            sessions = [session for session in self._active.values() if self.is_expired(session)]
+        for session in sessions:
+            try:
+                self.finish(session)
+            except Exception as e:
+                logging.error(f"Error expiring live transcription {session.stream_id}: {str(e)}")
+        return sessions
+
+    def take_transcript(self, stream_id, username):
+        """Pop a finished stream's transcript if it belongs to the user, else return None."""
+        with self._lock:
+            entry = self._finished.get(stream_id)
+            if entry is None or entry[0] != username:
+                return None
+            del self._finished[stream_id]
+            return entry[1]
+
+    def close_sid(self, sid):
+        """Abandon every active stream of a disconnected socket."""
+        with self._lock:
+            sessions = [session for session in self._active.values() if session.sid == sid]
+            for session in sessions:
+                del self._active[session.stream_id]
+        for session in sessions:
+            try:
+                session.finish()
+            except Exception as e:
+                logging.error(f"Error closing live transcription {session.stream_id}: {str(e)}")
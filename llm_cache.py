@@ -0,0 +1,134 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from provider_clients import wait
+
+def _normalize_text(text):
+    # Whitespace differences don't change what the model is asked
+    return " ".join(str(text).split())
+
+class LLMResponseCache:
+    """
+    Cache of completion texts for repeatable LLM calls, bounded by entry count (LRU)
+    and time-to-live. Identical calls made while one is in flight wait for it
+    instead of sending another request.
+    """
+
+    def __init__(self, max_entries=1024, ttl=600, clock=time.monotonic):
+        """
+        Args:
+            max_entries: Maximum number of cached responses
+            ttl: Seconds a response stays valid
+            clock: Time source, replaceable in tests
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def make_key(model, messages, contacts=None, **params):
+        """
+        Build the cache key for a chat completion.
+
+        Args:
+            model: Model name
+            messages: Chat messages; content whitespace is normalized
+            contacts: Contact names the prompt depends on, hashed order-independently
+            params: Remaining request parameters (temperature, max_tokens, ...)
+        """
+        contacts_hash = None
+        if contacts is not None:
+            contacts_hash = hashlib.sha256("\n".join(sorted(contacts)).encode("utf-8")).hexdigest()
+        payload = json.dumps({
+            "model": model,
+            "messages": [
+                {"role": message["role"], "content": _normalize_text(message["content"])}
+                for message in messages
+            ],
+            "params": params,
+            "contacts": contacts_hash
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return a cached response, or None if it is missing or expired."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self._counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        # Caller holds the lock
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get_or_create(self, key, create):
+        """
+        Return the cached response for key, or call create() once and cache its result.
+        Errors are not cached; callers waiting on a failed call get its exception.
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self._counters["hits"] += 1
+                return value
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                self._counters["misses"] += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self._counters["coalesced"] += 1
+        if not owner:
+            return wait(future)
+
+        try:
+            value = create()
+        except Exception as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if value is not None:
+                self._put(key, value)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return size, hit rate and eviction counters."""
+        with self._lock:
+            stats = dict(self._counters, size=len(self._entries), max_entries=self.max_entries)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,254 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+from functools import wraps
+
+# Latency histogram bucket bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = "voice_agent_"
+
+_HELP = {
+    "stage_duration_seconds": ("histogram", "Duration of pipeline stages and provider calls"),
+    "stage_errors_total": ("counter", "Pipeline stages and provider calls that raised"),
+    "stage_in_flight": ("gauge", "Pipeline stages and provider calls currently running"),
+    "http_request_duration_seconds": ("histogram", "Duration of HTTP requests by endpoint and status"),
+}
+
+# Trace of the request being handled, if any
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Trace:
+    """Stage timings of one request, reported back with its trace id."""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self._timings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._timings[stage] = self._timings.get(stage, 0.0) + seconds
+
+    def timings(self):
+        """Milliseconds spent per stage; concurrent stages overlap, so they can add up to more than the request."""
+        with self._lock:
+            return {stage: round(seconds * 1000, 1) for stage, seconds in self._timings.items()}
+
+class Metrics:
+    """
+    In-process latency histograms, counters and gauges, rendered in the Prometheus
+    text format. Component stats() (caches, router, queues) are read at scrape time.
+    Each worker process keeps its own metrics.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        """Add a sample to a latency histogram."""
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            histogram["buckets"][index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def add_gauge(self, name, amount, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def record(self, stage, seconds, provider="", operation="", error=False):
+        """Record a finished stage in the histograms and the current request's trace."""
+        self.observe("stage_duration_seconds", seconds, stage=stage, provider=provider, operation=operation)
+        if error:
+            self.inc("stage_errors_total", stage=stage, provider=provider, operation=operation)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(f"{stage}:{operation}" if operation else stage, seconds)
+
+    @contextmanager
+    def span(self, stage, provider="", operation=""):
+        """
+        Time a block as a pipeline stage.
+
+        Args:
+            stage: Stage name (stt, llm, tts, vector_store, ...)
+            provider: Provider serving the stage, if any
+            operation: What the stage did (e.g. the LLM call or vector store method)
+        """
+        self.add_gauge("stage_in_flight", 1, stage=stage, provider=provider, operation=operation)
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.add_gauge("stage_in_flight", -1, stage=stage, provider=provider, operation=operation)
+            self.record(stage, time.perf_counter() - start, provider, operation, error)
+
+    def timed(self, stage, provider="", operation=""):
+        """Decorator form of span."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, provider, operation):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register_collector(self, component, stats):
+        """
+        Export a component's stats() at scrape time. Numeric values become gauges named
+        voice_agent_<component>_<key>; nested dicts (e.g. per provider) get a "name" label.
+        """
+        self._collectors[component] = stats
+
+    def start_trace(self, trace_id):
+        """Start collecting stage timings for the current request."""
+        trace = Trace(trace_id)
+        _current_trace.set(trace)
+        return trace
+
+    def end_trace(self):
+        _current_trace.set(None)
+
+    def current_trace(self):
+        return _current_trace.get()
+
+    def _collect(self):
+        # Flatten component stats into gauge samples
+        gauges = OrderedDict()
+        for component, stats in list(self._collectors.items()):
+            try:
+                values = stats()
+            except Exception as e:
+                logging.error(f"Error collecting {component} metrics: {str(e)}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    for name, nested in value.items():
+                        for nested_key, nested_value in (nested.items() if isinstance(nested, dict) else []):
+                            if isinstance(nested_value, (int, float)):
+                                gauges.setdefault(f"{component}_{key}_{nested_key}", []).append(
+                                    ((("name", name),), float(nested_value)))
+                elif isinstance(value, (int, float)):
+                    gauges.setdefault(f"{component}_{key}", []).append(((), float(value)))
+        return gauges
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {name: {key: dict(h, buckets=list(h["buckets"])) for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+
+        lines = []
+
+        def header(name, kind):
+            help_text = _HELP.get(name, (kind, name.replace("_", " ")))[1]
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for name, series in sorted(histograms.items()):
+            header(name, "histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, [('le', _format_value(float(bound)))])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {_format_value(histogram['sum'])}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {histogram['count']}")
+
+        for name, series in sorted(counters.items()):
+            header(name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name, series in sorted(gauges.items()):
+            header(name, "gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name, samples in self._collect().items():
+            header(name, "gauge")
+            for key, value in samples:
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+def instrument_sqlalchemy():
+    """Time every SQL statement run through SQLAlchemy as a "db" stage."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        metrics.record("db", time.perf_counter() - start, "sqlalchemy", statement.split(None, 1)[0].lower())
+
+    @event.listens_for(Engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            operation = (context.statement or "").split(None, 1)[0].lower() if context.statement else ""
+            metrics.record("db", time.perf_counter() - starts.pop(), "sqlalchemy", operation, error=True)
+
+def instrument_socketio(socketio):
+    """Time every Socket.IO emit (including those relayed through a message queue), by event."""
+    server = socketio.server
+    server_emit = server.emit
+
+    def emit(event, *args, **kwargs):
+        with metrics.span("socketio_emit", "socketio", event):
+            return server_emit(event, *args, **kwargs)
+
+    server.emit = emit
+
+# Shared metrics for the app
+metrics = Metrics()
@@ -1,8 +1,14 @@
 import os
+import json
 import logging
-from openai import OpenAI
 from pinecone_database import retrieve_relevant_contexts
 from database_schema import User
+from contact_index import as_contact_index
+from conversation_store import create_conversation_store
+from llm_cache import LLMResponseCache
+from conversation_history import append_message, compact_history, prompt_messages, SUMMARY_MAX_TOKENS
+from provider_clients import get_openai_client, offload, wait
+from metrics import metrics
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -12,13 +18,55 @@ load_dotenv()
 logging.basicConfig(level=logging.DEBUG)
 
 # Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = get_openai_client()
+
+# Run each voice turn as one JSON-schema completion that also picks the recipient
+# and writes the final message, instead of separate detection and formatting calls
+STRUCTURED_TURNS = os.getenv("STRUCTURED_TURNS", "false").lower() == "true"
+
+# Turn at which the conversation is wrapped up regardless of the model's answer
+MAX_CONVERSATION_TURNS = 5
+
+# Contact lists up to this size go into the structured turn's schema as an enum; larger
+# ones are narrowed to the contacts mentioned, staying within OpenAI's enum limits
+STRUCTURED_ENUM_MAX_CONTACTS = 100
+
+# Responses of repeatable LLM calls (contact extraction, formatting, summaries)
+llm_cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl=int(os.getenv("LLM_CACHE_TTL", "600"))
+)
+
+def chat_completion(operation, on_text=None, **kwargs):
+    """
+    Run a chat completion, timed as an "llm" stage under the given operation name.
+    With on_text, the completion is streamed and its full text is returned.
+    """
+    with metrics.span("llm", "openai", operation):
+        if on_text is not None:
+            return offload(_stream_completion, on_text, **kwargs)
+        return offload(client.chat.completions.create, **kwargs)
+
+def cached_completion(operation, contacts=None, **kwargs):
+    """
+    Run a chat completion through llm_cache and return the message text.
+    Identical requests (same model, messages and parameters, and the same
+    contact list when given) are answered from the cache.
+    """
+    key = LLMResponseCache.make_key(contacts=contacts, **kwargs)
+    return llm_cache.get_or_create(
+        key,
+        lambda: chat_completion(operation, **kwargs).choices[0].message.content
+    )
 
 # Conversational system prompt
 SYSTEM_PROMPT = 'Voice assistant speaking fluent English. IMPORTANT: Outputs will be spoken aloud, so never use asterisks (*,-) or any text formatting. Use natural words, be warm, ask follow-up questions, reference previous exchanges. ALWAYS respond in English only, regardless of the input language.'
 
-# Dictionary to store conversation state for users
-user_conversations = {}
+# Conversation state for users, bounded and expiring (shared across workers with the redis backend)
+conversation_store = create_conversation_store()
+
+# Local recipient detections at or above this confidence skip the LLM call
+CONTACT_FAST_PATH_CONFIDENCE = float(os.getenv("CONTACT_FAST_PATH_CONFIDENCE", "0.9"))
 
 def validate_contact(detected_name, available_contacts):
     """
@@ -27,24 +75,16 @@ def validate_contact(detected_name, available_contacts):
     
     Args:
         detected_name (str): The detected contact name
-        available_contacts (list): List of available contact names
+        available_contacts (ContactIndex, ContactView or list): The available contacts
         
     Returns:
         str or None: The validated contact name with correct casing, or None if no match
     """
     if not detected_name or not available_contacts:
         return None
-        
-    # Normalize the detected name (lowercase, strip whitespace)
-    normalized_name = detected_name.lower().strip()
-    
-    # Check for exact match first (case insensitive)
-    for contact in available_contacts:
-        if contact.lower().strip() == normalized_name:
-            return contact  # Return the correctly cased version
     
-    # No exact match found
-    return None
+    # Hash lookup on the normalized name (lowercase, separators collapsed)
+    return as_contact_index(available_contacts).lookup(detected_name)
 
 def detect_contact_from_transcript(transcript, sender_username, available_contacts):
     """Detect a contact name from a transcript using AI."""
@@ -56,7 +96,9 @@ def detect_contact_from_transcript(transcript, sender_username, available_contac
     try:
         prompt = f"Message: \"{transcript}\"\nAvailable contacts: {', '.join(available_contacts)}\nExtract ONLY the recipient name from the list of contacts or respond with NONE."
         
-        response = client.chat.completions.create(
+        detected_name = cached_completion(
+            "detect_contact",
+            contacts=list(available_contacts),
             model="gpt-4o-mini-2024-07-18",
             messages=[
                 {"role": "system", "content": "Extract the recipient name mentioned in the message. Only respond with a name from the provided contacts list or NONE. ALWAYS respond in English only."},
@@ -64,25 +106,66 @@ def detect_contact_from_transcript(transcript, sender_username, available_contac
             ],
             max_tokens=20,
             temperature=0.0
-        )
-        
-        detected_name = response.choices[0].message.content.strip()
+        ).strip()
         logging.info(f"AI detected contact: '{detected_name}'")
         
         if detected_name.upper() == "NONE":
             return None
         
         # Match against available contacts (case-insensitive)
-        for contact in available_contacts:
-            if contact.lower() == detected_name.lower():
-                return contact
-                
-        return None
+        return validate_contact(detected_name, available_contacts)
             
     except Exception as e:
         logging.error(f"Error in contact detection: {str(e)}")
         return None
 
+@metrics.timed("contact_detection", "local")
+def detect_contact_locally(transcript, available_contacts):
+    """
+    Detect a contact with the deterministic contact index, without any API call.
+    
+    Returns:
+        dict: {"contact": name or None, "method": "local", "confidence": float}
+    """
+    if not transcript or not available_contacts:
+        return {"contact": None, "method": "local", "confidence": 0.0}
+    contact, confidence = as_contact_index(available_contacts).detect(transcript)
+    return {"contact": contact, "method": "local", "confidence": confidence}
+
+def is_confident_detection(detection):
+    """Whether a detection is certain enough to skip the LLM."""
+    return bool(detection["contact"]) and detection["confidence"] >= CONTACT_FAST_PATH_CONFIDENCE
+
+@metrics.timed("contact_detection")
+def detect_contact(transcript, sender_username, available_contacts, local_detection=None):
+    """
+    Detect the recipient, using the LLM only when the local detector isn't confident.
+    
+    Args:
+        transcript (str): The transcribed text
+        sender_username (str): The user sending the message
+        available_contacts (ContactIndex, ContactView or list): The available contacts
+        local_detection (dict): Result of detect_contact_locally, if already computed
+        
+    Returns:
+        dict: {"contact": name or None, "method": "local", "ai", "pattern" or "none",
+               "confidence": float or None}
+    """
+    if local_detection is None:
+        local_detection = detect_contact_locally(transcript, available_contacts)
+    if is_confident_detection(local_detection):
+        logging.info(f"Local contact detection: {local_detection['contact']} ({local_detection['confidence']:.2f})")
+        return local_detection
+    
+    ai_contact = detect_contact_from_transcript(transcript, sender_username, available_contacts)
+    if ai_contact:
+        return {"contact": ai_contact, "method": "ai", "confidence": None}
+    
+    # Fall back to the best local guess
+    if local_detection["contact"]:
+        return {"contact": local_detection["contact"], "method": "pattern", "confidence": local_detection["confidence"]}
+    return {"contact": None, "method": "none", "confidence": None}
+
 def generate_response(username, message, receiver=None):
     """Generate an AI response with conversation context"""
     # Get conversation context if available
@@ -105,7 +188,7 @@ def generate_response(username, message, receiver=None):
         prompt = f"{username}'s message: {message}\nRespond as {username}: "
     
     try:
-        response = client.chat.completions.create(
+        response = chat_completion("generate_response",
             model="gpt-4o-mini-2024-07-18",
             messages=[
                 {"role": "system", "content": f"You are {username}'s assistant. Be concise and friendly."},
@@ -127,16 +210,25 @@ def process_transcript_with_llm(username, transcript, receiver=None):
         logging.error(f"Error processing transcript: {str(e)}")
         return "Sorry, I encountered an issue processing your request."
 
-def transcribe_audio(audio_file_path):
-    """Transcribe an audio file using OpenAI's Whisper model."""
+def transcribe_audio(audio, filename="recording.wav"):
+    """
+    Transcribe audio using OpenAI's Whisper model.
+    The audio may be a file path, bytes, or a binary file-like object such as an
+    upload stream; the filename's extension tells Whisper the audio format.
+    """
+    if isinstance(audio, (str, os.PathLike)):
+        with open(audio, "rb") as audio_file:
+            return transcribe_audio(audio_file, os.path.basename(audio))
+    
     try:
-        logging.info(f"Transcribing audio file: {audio_file_path}")
+        logging.info(f"Transcribing audio: {filename}")
         
-        with open(audio_file_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
+        if hasattr(audio, 'seek'):
+            audio.seek(0)
+        transcript = offload(client.audio.transcriptions.create,
+            model="whisper-1",
+            file=(filename, audio)
+        )
             
         logging.info(f"Transcription completed: {transcript.text[:50]}...")
         return transcript.text
@@ -152,8 +244,9 @@ def process_message(transcript, sender_username, receiver_username=None):
         # Format: "Hey [recipient]!, [sender] wants to inform u that..."
         prompt = f"Message from {sender_username} to {receiver_username}: \"{transcript}\"\nRewrite as: \"Hey {receiver_username}!, {sender_username} wants to inform u that...\""
         
-        # Call OpenAI API to generate a response
-        response = client.chat.completions.create(
+        # Call OpenAI API to generate a response (retries are served from the cache)
+        return cached_completion(
+            "process_message",
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "Format messages as: Hey [recipient]!, [sender] wants to inform u that..."},
@@ -161,48 +254,115 @@ def process_message(transcript, sender_username, receiver_username=None):
             ],
             temperature=0.7,
             max_tokens=150
-        )
-        
-        return response.choices[0].message.content.strip()
+        ).strip()
         
     except Exception as e:
         logging.error(f"Error processing message: {str(e)}")
         return f"Hey {receiver_username}!, {sender_username} wants to inform u that {transcript}"
 
-def conversational_interaction(user_id, user_message, available_contacts=None):
-    """Process a message in a conversational manner, with follow-up questions and contact detection."""
-    # Initialize or retrieve conversation state
-    if user_id not in user_conversations:
-        user_conversations[user_id] = {
-            "history": [],
-            "ready_to_send": False,
-            "detected_recipient": None,
-            "final_message": None,
-            "turns": 0
-        }
-    
-    conversation = user_conversations[user_id]
+def _apply_pending_detection(conversation, pending_detection):
+    """Wait for an in-flight contact detection and record its result on the conversation."""
+    if pending_detection is None or conversation["detected_recipient"]:
+        return
+    try:
+        detected_contact = wait(pending_detection)["contact"]
+    except Exception as e:
+        logging.error(f"Error in contact detection: {str(e)}")
+        return
+    if detected_contact:
+        logging.info(f"Contact detected: {detected_contact}")
+        conversation["detected_recipient"] = detected_contact
+
+def conversational_interaction(user_id, user_message, available_contacts=None, contact_detection=None, on_text=None):
+    """
+    Process a message in a conversational manner, with follow-up questions and contact detection.
     
-    # Add the user's message to history
-    conversation["history"].append({"role": "user", "content": user_message})
+    Args:
+        user_id (str): The user composing the message
+        user_message (str): The latest transcript from the user
+        available_contacts (list): List of available contact names
+        contact_detection (Future): Optional in-flight result of detect_contact
+            for this message. It is reused instead of detecting again, and if it is still
+            running the follow-up question is generated without waiting for it.
+        on_text (callable): Optional callback for streaming the follow-up question.
+            It receives each text delta as the model generates it (from a worker
+            thread under eventlet), and the result has "streamed" set to True.
+            Replies that end the conversation are not streamed.
+    """
+    # Initialize or retrieve conversation state
+    conversation = conversation_store.get(user_id) or new_conversation_state()
+    try:
+        return _conversation_turn(conversation, user_id, user_message, available_contacts, contact_detection, on_text)
+    finally:
+        # Write the updated state back to the store
+        conversation_store.put(user_id, conversation)
+
+def new_conversation_state(recipient=None):
+    """Return the initial state of a voice conversation."""
+    return {
+        "history": [],
+        "ready_to_send": False,
+        "detected_recipient": recipient,
+        "final_message": None,
+        "turns": 0,
+        "summary": None,
+        "summary_tokens": 0
+    }
+
+def get_conversation(user_id):
+    """Return a copy of a user's conversation state, or None if there is none."""
+    return conversation_store.get(user_id)
+
+def _stream_completion(on_text, **kwargs):
+    """Run a streamed chat completion, passing each text delta to on_text, and return the full text."""
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    parts = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            on_text(delta)
+    return "".join(parts)
+
+def _conversation_turn(conversation, user_id, user_message, available_contacts, contact_detection, on_text=None):
+    """Run one turn of conversational_interaction against the loaded state."""
+    # Add the user's message to history, folding older turns into the summary if over budget
+    append_message(conversation, "user", user_message)
     conversation["turns"] += 1
+    compact_history(conversation, summarize_history)
+    
+    if STRUCTURED_TURNS:
+        try:
+            return _structured_turn(conversation, user_id, available_contacts, contact_detection)
+        except Exception as e:
+            logging.error(f"Structured turn failed, falling back: {str(e)}")
     
     # Check for contacts if none detected yet
+    pending_detection = None
     if not conversation["detected_recipient"] and available_contacts:
-        detected_contact = detect_contact_from_transcript(
-            user_message,
-            user_id,
-            available_contacts
-        )
-        if detected_contact:
-            logging.info(f"Contact detected: {detected_contact}")
-            conversation["detected_recipient"] = detected_contact
+        if contact_detection is None:
+            detected_contact = detect_contact(
+                user_message,
+                user_id,
+                available_contacts
+            )["contact"]
+            if detected_contact:
+                logging.info(f"Contact detected: {detected_contact}")
+                conversation["detected_recipient"] = detected_contact
+        elif contact_detection.done():
+            _apply_pending_detection(conversation, contact_detection)
+        else:
+            # Still running - overlap it with the follow-up generation below
+            pending_detection = contact_detection
     
     # Check if this is a "send now" message
     send_keywords = ["send", "send it", "that's it", "done", "go ahead"]
     if any(keyword in user_message.lower() for keyword in send_keywords) and conversation["turns"] > 2:
+        _apply_pending_detection(conversation, pending_detection)
         conversation["ready_to_send"] = True
-        final_message = generate_final_message(conversation["history"], user_id, conversation["detected_recipient"])
+        final_message = generate_final_message(conversation["history"], user_id, conversation["detected_recipient"], summary=conversation.get("summary"))
         conversation["final_message"] = final_message
         
         return {
@@ -229,36 +389,51 @@ def conversational_interaction(user_id, user_message, available_contacts=None):
     messages = [
         {"role": "system", "content": system_content}
     ]
-    messages.extend(conversation["history"])
+    messages.extend(prompt_messages(conversation))
+    
+    # The last turn's reply is replaced by the final message, so it isn't streamed
+    stream_reply = on_text is not None and conversation["turns"] < MAX_CONVERSATION_TURNS
     
     try:
-        # Call OpenAI API for a response
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=150
-        )
+        if stream_reply:
+            # Stream the reply so speech synthesis can start on its first sentence
+            assistant_message = chat_completion("conversation_turn", on_text,
+                model="gpt-4o-mini-2024-07-18",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=150
+            ).strip()
+        else:
+            # Call OpenAI API for a response
+            response = chat_completion("conversation_turn",
+                model="gpt-4o-mini-2024-07-18",
+                messages=messages,
+                temperature=0.7,
+                max_tokens=150
+            )
+            assistant_message = response.choices[0].message.content.strip()
         
         # Add assistant response to conversation history
-        assistant_message = response.choices[0].message.content.strip()
-        conversation["history"].append({"role": "assistant", "content": assistant_message})
+        append_message(conversation, "assistant", assistant_message)
+        _apply_pending_detection(conversation, pending_detection)
         
         # Check if max turns reached
-        if conversation["turns"] >= 5:
+        if conversation["turns"] >= MAX_CONVERSATION_TURNS:
             conversation["ready_to_send"] = True
-            final_message = generate_final_message(conversation["history"], user_id, conversation["detected_recipient"])
+            final_message = generate_final_message(conversation["history"], user_id, conversation["detected_recipient"], summary=conversation.get("summary"))
             conversation["final_message"] = final_message
         
         return {
             "response": assistant_message,
             "ready_to_send": conversation["ready_to_send"],
             "final_message": conversation["final_message"],
-            "detected_recipient": conversation["detected_recipient"]
+            "detected_recipient": conversation["detected_recipient"],
+            "streamed": stream_reply
         }
     
     except Exception as e:
         logging.error(f"Error in conversation: {str(e)}")
+        _apply_pending_detection(conversation, pending_detection)
         return {
             "response": "I'm having trouble processing your request.",
             "ready_to_send": False,
@@ -266,8 +441,167 @@ def conversational_interaction(user_id, user_message, available_contacts=None):
             "detected_recipient": conversation["detected_recipient"]
         }
 
-def generate_final_message(conversation_history, user_id, recipient=None):
-    """Generate a final message from conversation history."""
+def summarize_history(previous_summary, messages):
+    """
+    Fold conversation messages into a running summary of what the user wants to say.
+    
+    Args:
+        previous_summary (str): The summary so far, or None
+        messages (list): History messages being folded into it, oldest first
+    """
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n{transcript}"
+    
+    return cached_completion(
+        "summarize_history",
+        model="gpt-4o-mini-2024-07-18",
+        messages=[
+            {"role": "system", "content": "Summarize this conversation about composing a voice message. Keep every detail the user wants in the message (people, times, places, requests) and drop the assistant's questions. Be brief. ALWAYS write in English only."},
+            {"role": "user", "content": transcript}
+        ],
+        temperature=0.2,
+        max_tokens=SUMMARY_MAX_TOKENS
+    ).strip()
+
+def recipient_candidates(conversation, available_contacts):
+    """
+    Contacts to offer the structured turn as recipients: all of them when there are
+    few, otherwise the ones mentioned (or fuzzily matched) in the user's messages.
+    
+    Returns:
+        tuple: (sorted candidate names, whether the list is every contact)
+    """
+    if not available_contacts:
+        return [], True
+    if len(available_contacts) <= STRUCTURED_ENUM_MAX_CONTACTS:
+        return sorted(available_contacts), True
+    
+    index = as_contact_index(available_contacts)
+    text = " ".join(
+        [conversation.get("summary") or ""] +
+        [message["content"] for message in conversation["history"] if message["role"] == "user"]
+    )
+    found = index.mentions(text)
+    fuzzy = index.find_recipient(text)
+    if fuzzy and fuzzy not in found:
+        found.append(fuzzy)
+    return sorted(found[:STRUCTURED_ENUM_MAX_CONTACTS]), False
+
+def turn_schema(candidates, complete=True):
+    """
+    JSON schema for a structured voice turn.
+    The recipient is limited to the candidates when they are every contact or some
+    were found; otherwise it is a free name, validated against the contacts afterwards.
+    """
+    if candidates:
+        recipient = {"anyOf": [{"type": "string", "enum": list(candidates)}, {"type": "null"}]}
+    elif complete:
+        recipient = {"type": "null"}
+    else:
+        recipient = {"anyOf": [{"type": "string"}, {"type": "null"}]}
+    return {
+        "name": "voice_turn",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "recipient": recipient,
+                "reply": {"type": "string"},
+                "ready_to_send": {"type": "boolean"},
+                "message_body": {"anyOf": [{"type": "string"}, {"type": "null"}]}
+            },
+            "required": ["recipient", "reply", "ready_to_send", "message_body"],
+            "additionalProperties": False
+        }
+    }
+
+def _structured_turn(conversation, user_id, available_contacts, contact_detection):
+    """
+    Run a conversation turn as a single JSON-schema completion returning the recipient,
+    the spoken reply, whether the message is ready and, if so, the body of the message.
+    A confident local detection that is already available is passed in as the recipient;
+    the model may switch to another contact the user names. The relay greeting is added
+    here around the body, so it always names the recipient the message is sent to.
+    """
+    if not conversation["detected_recipient"] and contact_detection is not None and contact_detection.done():
+        detection = contact_detection.result()
+        if is_confident_detection(detection):
+            conversation["detected_recipient"] = detection["contact"]
+    
+    candidates, complete = recipient_candidates(conversation, available_contacts)
+    if candidates:
+        contacts_line = ", ".join(candidates) + ("" if complete else " (possible matches among many contacts)")
+    else:
+        contacts_line = "none" if complete else "too many to list; give the recipient's name as the user said it"
+    recipient = conversation["detected_recipient"]
+    last_turn = conversation["turns"] >= MAX_CONVERSATION_TURNS
+    system_content = f"""You are helping {user_id} compose a voice message to relay to one of their contacts.
+Contacts: {contacts_line}
+Recipient so far: {recipient or 'unknown'}
+
+For every user turn, return:
+- recipient: the contact the message is for (keep the recipient so far unless the user changes it), or null
+- reply: one short spoken sentence. Ask one specific follow-up question about missing details (time, place, context), or confirm that the message is ready
+- ready_to_send: true when the user confirms (e.g. "send it", "that's it") or has given everything needed
+- message_body: when ready_to_send, what {user_id} wants the recipient to know, combining every detail the user gave, without a greeting or confirmation phrases, written to follow "{user_id} wants to inform u that" (e.g. "the meeting moved to 3 pm"); otherwise null
+{"This is the last turn: set ready_to_send to true." if last_turn else ""}
+ALWAYS respond in English only."""
+    
+    messages = [{"role": "system", "content": system_content}]
+    messages.extend(prompt_messages(conversation))
+    
+    response = chat_completion("structured_turn",
+        model="gpt-4o-mini-2024-07-18",
+        messages=messages,
+        response_format={"type": "json_schema", "json_schema": turn_schema(candidates, complete)},
+        temperature=0.3,
+        max_tokens=400
+    )
+    result = json.loads(response.choices[0].message.content)
+    
+    detection_method = None
+    returned_recipient = validate_contact(result["recipient"], available_contacts) if result["recipient"] else None
+    if returned_recipient and returned_recipient != conversation["detected_recipient"]:
+        if conversation["detected_recipient"]:
+            logging.info(f"Recipient changed by structured turn: {conversation['detected_recipient']} -> {returned_recipient}")
+        else:
+            logging.info(f"Contact detected by structured turn: {returned_recipient}")
+        conversation["detected_recipient"] = returned_recipient
+        detection_method = "structured"
+    
+    reply = result["reply"].strip()
+    append_message(conversation, "assistant", reply)
+    
+    if result["ready_to_send"] or last_turn:
+        conversation["ready_to_send"] = True
+        body = (result["message_body"] or "").strip()
+        if body:
+            conversation["final_message"] = format_relay_message(body, user_id, conversation["detected_recipient"])
+        else:
+            conversation["final_message"] = generate_final_message(
+                conversation["history"], user_id, conversation["detected_recipient"], summary=conversation.get("summary")
+            )
+    
+    return {
+        "response": reply,
+        "ready_to_send": conversation["ready_to_send"],
+        "final_message": conversation["final_message"],
+        "detected_recipient": conversation["detected_recipient"],
+        "detection_method": detection_method,
+        "streamed": False
+    }
+
+def format_relay_message(body, user_id, recipient=None):
+    """Wrap a message body in the relay format, or return it as is without a recipient."""
+    if not recipient:
+        return body
+    if body.lower().startswith("that "):
+        body = body[len("that "):]
+    return f"Hey {recipient}!, {user_id} wants to inform u that {body}"
+
+def generate_final_message(conversation_history, user_id, recipient=None, summary=None):
+    """Generate a final message from conversation history and the summary of earlier turns."""
     try:
         # Extract user messages
         user_inputs = [msg["content"] for msg in conversation_history if msg["role"] == "user"]
@@ -278,7 +612,7 @@ def generate_final_message(conversation_history, user_id, recipient=None):
                         "yes, send the message", "yes send the message", "send the message"]
         
         # Check if the last message is just a confirmation
-        if user_inputs and len(user_inputs) > 1:
+        if user_inputs and (len(user_inputs) > 1 or summary):
             last_message = user_inputs[-1].lower()
             is_short = len(last_message.split()) <= 5
             has_confirmation = any(phrase in last_message for phrase in send_phrases)
@@ -287,8 +621,8 @@ def generate_final_message(conversation_history, user_id, recipient=None):
                 # Remove the last message if it's just a confirmation
                 user_inputs = user_inputs[:-1]
         
-        # Combine all remaining user messages
-        combined_input = " ".join(user_inputs)
+        # Combine the summary of folded turns with the remaining user messages
+        combined_input = " ".join(([summary] if summary else []) + user_inputs)
         
         # Create prompt based on whether recipient is known
         if recipient:
@@ -324,7 +658,8 @@ Your task:
 7. IMPORTANT: ALWAYS respond in English only, regardless of input language
 """
         
-        response = client.chat.completions.create(
+        message = cached_completion(
+            "final_message",
             model="gpt-4o-mini-2024-07-18",
             messages=[
                 {"role": "system", "content": "You are a helpful message formatting assistant that creates coherent summaries from conversations. ALWAYS write in English only."},
@@ -332,9 +667,7 @@ Your task:
             ],
             temperature=0.3,
             max_tokens=400
-        )
-        
-        message = response.choices[0].message.content.strip()
+        ).strip()
         
         # Ensure proper format if recipient is specified
         if recipient and not message.startswith(f"Hey {recipient}!"):
@@ -366,18 +699,10 @@ Your task:
 
 def update_conversation_recipient(user_id, recipient):
     """Update the detected recipient for a user's conversation"""
-    if user_id in user_conversations:
-        user_conversations[user_id]["detected_recipient"] = recipient
-    else:
-        user_conversations[user_id] = {
-            "history": [],
-            "ready_to_send": False,
-            "detected_recipient": recipient,
-            "final_message": None,
-            "turns": 0
-        }
+    conversation = conversation_store.get(user_id) or new_conversation_state()
+    conversation["detected_recipient"] = recipient
+    conversation_store.put(user_id, conversation)
 
 def reset_conversation(user_id):
     """Reset a user's conversation state"""
-    if user_id in user_conversations:
-        del user_conversations[user_id]
\ No newline at end of file
+    conversation_store.delete(user_id)
\ No newline at end of file
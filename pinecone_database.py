@@ -1,37 +1,28 @@
 import os
-from pinecone import Pinecone, ServerlessSpec
+import threading
+from collections import OrderedDict
 import logging
+from embedding_service import embedding_service
+from vector_store import create_vector_store
 
-# Initialize Pinecone instance
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-
-# Define a valid Pinecone index name
-INDEX_NAME = "conversation-contexts"  # Must be lowercase and use hyphens
-
-# Ensure the index exists
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=1536,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
-        )
-    )
+# Vector store for conversation contexts (Pinecone by default, or in-process NumPy)
+vector_store = create_vector_store()
+
+# Number of messages per conversation memory window; only the open window is re-embedded
+CONTEXT_WINDOW_SIZE = int(os.getenv("CONTEXT_WINDOW_SIZE", "20"))
 
-pinecone_index = pc.Index(INDEX_NAME)
+# Open (most recent) window number per conversation, so appends don't need to list the windows
+_open_windows = OrderedDict()
+_open_windows_lock = threading.Lock()
+MAX_CACHED_WINDOWS = 1024
 
 def get_embedding(text):
-    """Convert text to embedding vector using OpenAI."""
-    from openai import OpenAI
-    client = OpenAI()
-    response = client.embeddings.create(model="text-embedding-ada-002", input=text)
-    return response.data[0].embedding
+    """Convert text to embedding vector using the shared OpenAI embedding service."""
+    return embedding_service.embed(text)
 
 def store_conversation_context(conversation_id, context_text, metadata=None):
     """
-    Store conversation context in Pinecone to improve AI response relevance.
+    Store conversation context in the vector store to improve AI response relevance.
     
     Args:
         conversation_id: A unique identifier for the conversation (e.g., "user1_user2")
@@ -55,19 +46,35 @@ def store_conversation_context(conversation_id, context_text, metadata=None):
         
         print(f"Storing conversation context for {conversation_id}")
         
-        # Include metadata as a separate parameter
-        pinecone_index.upsert(
-            vectors=[(conversation_id, vector)],
-            metadata={conversation_id: metadata}
-        )
+        vector_store.upsert([(conversation_id, vector, metadata)])
         return True
     except Exception as e:
         print(f"Error storing conversation context: {e}")
         return False
 
+def conversation_id_for(user1, user2):
+    """Conversation id shared by two users, independent of their order (e.g. "alice_bob")."""
+    participants = sorted([user1, user2])
+    return f"{participants[0]}_{participants[1]}"
+
+def participant_filter(user1=None, user2=None):
+    """
+    Build the Pinecone metadata filter that scopes a query to a conversation.
+    
+    Returns:
+        dict or None: The filter, or None when no participant is given
+    """
+    if user1 and user2:
+        return {"conversation_id": {"$eq": conversation_id_for(user1, user2)}}
+    if user1 or user2:
+        return {"participants": {"$in": [user1 or user2]}}
+    return None
+
 def retrieve_relevant_contexts(query_text, user1=None, user2=None, top_k=3):
     """
     Retrieve relevant conversation contexts based on semantic similarity.
+    When participants are given the query is filtered server-side, so top_k
+    only ranks that conversation's windows.
     
     Args:
         query_text: The current message or conversation to find relevant contexts for
@@ -81,30 +88,31 @@ def retrieve_relevant_contexts(query_text, user1=None, user2=None, top_k=3):
         # Generate embedding for the query
         query_vector = get_embedding(query_text)
         
-        # Query Pinecone for similar conversation contexts
-        query_response = pinecone_index.query(
-            vector=query_vector,
+        # Query the vector store for similar conversation contexts
+        matches = vector_store.query(
+            query_vector,
             top_k=top_k,
-            include_metadata=True
+            filter=participant_filter(user1, user2)
         )
         
         relevant_contexts = []
         
-        if hasattr(query_response, 'matches') and query_response.matches:
-            for match in query_response.matches:
-                if hasattr(match, 'metadata') and match.metadata:
-                    # Filter by participants if specified
-                    if user1 and user2:
-                        participants = match.metadata.get('participants', [])
-                        if user1 not in participants or user2 not in participants:
-                            continue
-                    
-                    # Add the context text to the list
-                    if 'text' in match.metadata:
-                        relevant_contexts.append({
-                            'text': match.metadata['text'],
-                            'score': match.score
-                        })
+        for match in matches:
+            metadata = match['metadata']
+            # Guard against vectors the filter can't see correctly
+            if user1 and user2:
+                participants = metadata.get('participants', [])
+                if user1 not in participants or user2 not in participants:
+                    continue
+            
+            # Add the context text to the list
+            if 'text' in metadata:
+                relevant_contexts.append({
+                    'id': match['id'],
+                    'text': metadata['text'],
+                    'score': match['score'],
+                    'window': metadata.get('window')
+                })
         
         return relevant_contexts
     
@@ -112,9 +120,121 @@ def retrieve_relevant_contexts(query_text, user1=None, user2=None, top_k=3):
         print(f"Error retrieving conversation contexts: {e}")
         return []
 
+def window_vector_id(conversation_id, window):
+    """Vector id of one memory window of a conversation, e.g. "alice_bob#3"."""
+    return f"{conversation_id}#{window}"
+
+def _window_messages(metadata):
+    return [line for line in (metadata or {}).get('text', '').split("\n") if line]
+
+def _load_open_window(conversation_id):
+    """
+    Get the open window of a conversation as {"window": n, "messages": [...]}.
+    Its messages are always read from the vector store, since other workers may
+    have appended to it. The cached window number saves listing the conversation's
+    windows: that window and the next are fetched together, and the listing is only
+    done when the cached number is unknown or stale.
+    """
+    with _open_windows_lock:
+        window = _open_windows.get(conversation_id)
+        if window is not None:
+            _open_windows.move_to_end(conversation_id)
+    
+    if window is not None:
+        current_id = window_vector_id(conversation_id, window)
+        next_id = window_vector_id(conversation_id, window + 1)
+        fetched = vector_store.fetch([current_id, next_id])
+        if next_id not in fetched and current_id in fetched:
+            return {"window": window, "messages": _window_messages(fetched[current_id])}
+    
+    prefix = f"{conversation_id}#"
+    windows = []
+    for page in vector_store.list_ids(prefix=prefix):
+        for vector_id in page:
+            suffix = vector_id[len(prefix):]
+            if suffix.isdigit():
+                windows.append(int(suffix))
+    
+    state = {"window": 0, "messages": []}
+    if windows:
+        window = max(windows)
+        vector_id = window_vector_id(conversation_id, window)
+        state = {"window": window, "messages": _window_messages(vector_store.fetch([vector_id]).get(vector_id))}
+    
+    return state
+
+def _remember_open_window(conversation_id, window):
+    with _open_windows_lock:
+        _open_windows[conversation_id] = window
+        _open_windows.move_to_end(conversation_id)
+        while len(_open_windows) > MAX_CACHED_WINDOWS:
+            _open_windows.popitem(last=False)
+
+def append_conversation_messages(updates):
+    """
+    Append messages to several conversations with one embedding batch and one upsert.
+    Each touched window is re-embedded once no matter how many messages it received.
+    Errors are raised to the caller.
+    
+    Args:
+        updates: List of (conversation_id, messages, participants) tuples
+    
+    Returns:
+        int: Number of window vectors written
+    """
+    records = []
+    new_states = {}
+    for conversation_id, new_messages, participants in updates:
+        state = new_states.get(conversation_id) or _load_open_window(conversation_id)
+        window = state["window"]
+        messages = list(state["messages"])
+        
+        touched = OrderedDict()
+        for new_message in new_messages:
+            # Start a new window once the open one is full
+            if len(messages) >= CONTEXT_WINDOW_SIZE:
+                window += 1
+                messages = []
+            messages.append(new_message)
+            touched[window] = list(messages)
+        
+        for touched_window, window_messages in touched.items():
+            records.append((conversation_id, touched_window, "\n".join(window_messages), participants))
+        new_states[conversation_id] = {"window": window, "messages": messages}
+    
+    if not records:
+        return 0
+    
+    vectors = embedding_service.embed_many([text for _, _, text, _ in records])
+    timestamp = str(import_datetime().utcnow())
+    print(f"Storing {len(records)} conversation context window(s)")
+    vector_store.upsert(
+        [
+            (
+                window_vector_id(conversation_id, window),
+                vector,
+                {
+                    "text": text,
+                    "timestamp": timestamp,
+                    "participants": participants,
+                    "conversation_id": conversation_id,
+                    "window": window
+                }
+            )
+            for (conversation_id, window, text, participants), vector in zip(records, vectors)
+        ]
+    )
+    
+    for conversation_id, state in new_states.items():
+        _remember_open_window(conversation_id, state["window"])
+    return len(records)
+
 def update_conversation_context(conversation_id, new_message, participants):
     """
-    Update an existing conversation context with a new message
+    Append a new message to a conversation's memory.
+    Messages are grouped into windows of CONTEXT_WINDOW_SIZE, each stored as its
+    own vector ("conversation_id#n"). Only the open window is re-embedded, so the
+    cost per message stays constant as the conversation grows.
     
     Args:
         conversation_id: The unique conversation identifier
@@ -125,33 +245,56 @@ def update_conversation_context(conversation_id, new_message, participants):
         Boolean indicating success
     """
     try:
-        # First try to fetch the existing context
-        fetch_response = pinecone_index.fetch(ids=[conversation_id])
-        
-        existing_context = ""
-        if hasattr(fetch_response, 'vectors') and conversation_id in fetch_response.vectors:
-            if hasattr(fetch_response.vectors[conversation_id], 'metadata'):
-                metadata = fetch_response.vectors[conversation_id].metadata
-                if metadata is not None:
-                    existing_context = metadata.get('text', '')
-        
-        # Append the new message to the existing context
-        updated_context = f"{existing_context}\n{new_message}".strip()
-        
-        # Store the updated context
-        return store_conversation_context(
-            conversation_id=conversation_id,
-            context_text=updated_context,
-            metadata={
-                "participants": participants,
-                "timestamp": str(import_datetime().utcnow())
-            }
-        )
+        append_conversation_messages([(conversation_id, [new_message], participants)])
+        return True
     
     except Exception as e:
         print(f"Error updating conversation context: {str(e)}")
         return False
 
+def migrate_conversation_metadata(batch_size=100):
+    """
+    Add the conversation_id metadata used by participant-scoped retrieval to
+    vectors written before it existed. Safe to run repeatedly; vectors that
+    already carry it are skipped.
+    
+    Args:
+        batch_size: Number of vectors fetched per request
+    
+    Returns:
+        dict: Counts of updated, skipped and unmigratable vectors
+    """
+    counts = {"updated": 0, "skipped": 0, "unmigratable": 0}
+    
+    for vector_ids in vector_store.list_ids(batch_size=batch_size):
+        fetched = vector_store.fetch(vector_ids)
+        
+        for vector_id in vector_ids:
+            metadata = fetched.get(vector_id) or {}
+            if metadata.get("conversation_id"):
+                counts["skipped"] += 1
+                continue
+            
+            participants = metadata.get("participants") or []
+            if len(participants) == 2:
+                conversation_id = conversation_id_for(*participants)
+            elif "_" in vector_id.split("#")[0]:
+                conversation_id = vector_id.split("#")[0]
+                participants = conversation_id.split("_", 1)
+            else:
+                logging.warning(f"Cannot determine conversation for vector {vector_id}")
+                counts["unmigratable"] += 1
+                continue
+            
+            vector_store.update_metadata(vector_id, {
+                "conversation_id": conversation_id,
+                "participants": sorted(participants)
+            })
+            counts["updated"] += 1
+    
+    logging.info(f"Conversation metadata migration finished: {counts}")
+    return counts
+
 def import_datetime():
     """Helper to import datetime"""
     from datetime import datetime
@@ -0,0 +1,312 @@
+import os
+import time
+import logging
+import threading
+from kv_store import create_kv_client
+
+def user_room(username):
+    """Socket.IO room joined by every connection of a user."""
+    return f"user:{username}"
+
+class MemoryPresenceRegistry:
+    """Connection registry for a single worker process."""
+
+    def __init__(self):
+        self._sids = {}
+        self._usernames = {}
+        self._lock = threading.Lock()
+
+    def add(self, username, sid):
+        """Record a connection; returns True if it is the user's first one."""
+        with self._lock:
+            self._usernames[sid] = username
+            sids = self._sids.setdefault(username, set())
+            sids.add(sid)
+            return len(sids) == 1
+
+    def remove(self, sid):
+        """Forget a connection; returns the username if it was the user's last one."""
+        with self._lock:
+            username = self._usernames.pop(sid, None)
+            if username is None:
+                return None
+            sids = self._sids.get(username, set())
+            sids.discard(sid)
+            if sids:
+                return None
+            self._sids.pop(username, None)
+            return username
+
+    def is_online(self, username):
+        return username in self._sids
+
+    def owns(self, username, sid):
+        """True if the sid is a current connection of the user."""
+        with self._lock:
+            return self._usernames.get(sid) == username
+
+    def online_users(self):
+        with self._lock:
+            return list(self._sids)
+
+    def directory_version(self):
+        return 0
+
+    def bump_directory_version(self):
+        return 0
+
+    # Connections only live in this process, so there is nothing to refresh
+    heartbeat_interval = None
+
+    def heartbeat(self):
+        pass
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+class KeyValuePresenceRegistry:
+    """
+    Connection registry shared by all workers through a key-value server.
+    Each user has a sorted set of its sids scored by expiry time, and one sorted set
+    of online users (also scored by expiry) answers online_users in a single read.
+    Workers refresh the expiry of their own sockets with heartbeat(), so the
+    connections of a worker that dies without disconnecting drop out after ttl seconds.
+    """
+
+    def __init__(self, client, prefix="presence:", ttl=90, clock=time.time):
+        """
+        Args:
+            client: redis.Redis or kv_store.LocalKeyValueClient
+            prefix: Key prefix for presence entries
+            ttl: Seconds a connection stays registered without a heartbeat
+            clock: Time source, replaceable in tests
+        """
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.heartbeat_interval = ttl / 3
+        self._clock = clock
+        # This worker's sockets; disconnects arrive at the worker holding the socket
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def _user_key(self, username):
+        return f"{self.prefix}user:{username}"
+
+    def _online_key(self):
+        return f"{self.prefix}online"
+
+    def _live_connections(self, username, now):
+        key = self._user_key(username)
+        self.client.zremrangebyscore(key, "-inf", now)
+        return self.client.zcard(key)
+
+    def add(self, username, sid):
+        """Record a connection (idempotent per sid); returns True if it is the user's first one."""
+        now = self._clock()
+        with self._lock:
+            self._local[sid] = username
+        key = self._user_key(username)
+        added = self.client.zadd(key, {sid: now + self.ttl})
+        self.client.expire(key, int(self.ttl))
+        self.client.zadd(self._online_key(), {username: now + self.ttl})
+        return bool(added) and self._live_connections(username, now) == 1
+
+    def remove(self, sid):
+        with self._lock:
+            username = self._local.pop(sid, None)
+        if username is None:
+            return None
+        self.client.zrem(self._user_key(username), sid)
+        if self._live_connections(username, self._clock()) > 0:
+            return None
+        self.client.zrem(self._online_key(), username)
+        return username
+
+    def owns(self, username, sid):
+        """True if the sid is a current connection of the user, on any worker."""
+        with self._lock:
+            if self._local.get(sid) == username:
+                return True
+        expires_at = self.client.zscore(self._user_key(username), sid)
+        return expires_at is not None and float(expires_at) > self._clock()
+
+    def is_online(self, username):
+        expires_at = self.client.zscore(self._online_key(), username)
+        return expires_at is not None and float(expires_at) > self._clock()
+
+    def online_users(self):
+        return [_decode(username) for username in self.client.zrangebyscore(self._online_key(), self._clock(), "+inf")]
+
+    def heartbeat(self):
+        """Extend this worker's connections; call every heartbeat_interval seconds."""
+        now = self._clock()
+        expires_at = now + self.ttl
+        with self._lock:
+            connections = list(self._local.items())
+        for sid, username in connections:
+            self.client.zadd(self._user_key(username), {sid: expires_at})
+            self.client.expire(self._user_key(username), int(self.ttl))
+        users = {username for _, username in connections}
+        if users:
+            self.client.zadd(self._online_key(), {username: expires_at for username in users})
+        # Users whose workers stopped refreshing them are offline
+        self.client.zremrangebyscore(self._online_key(), "-inf", now)
+
+    def directory_version(self):
+        return int(self.client.get(f"{self.prefix}directory_version") or 0)
+
+    def bump_directory_version(self):
+        return self.client.incr(f"{self.prefix}directory_version")
+
+class Presence:
+    """
+    Tracks which users are online and caches the user directory.
+    Connections are kept in a registry (per process, or shared through Redis when
+    running several workers), and the directory is loaded from the database only
+    once and reloaded when another worker registers a new user.
+    """
+
+    def __init__(self, load_directory, registry=None):
+        """
+        Args:
+            load_directory: Callable returning the full user list as dicts (from User.to_dict)
+            registry: Connection registry (defaults to a per-process one)
+        """
+        self._load_directory = load_directory
+        self.registry = registry or MemoryPresenceRegistry()
+        self._directory = None
+        self._directory_version = None
+        self._reload_listeners = []
+        self._reload_pending = False
+        self._lock = threading.RLock()
+
+    def connect(self, username, sid):
+        """
+        Record a user's socket. Users may have several sockets (tabs, devices).
+
+        Returns:
+            bool: True if the user was offline before this connection
+        """
+        return self.registry.add(username, sid)
+
+    def disconnect(self, sid):
+        """
+        Forget a socket.
+
+        Returns:
+            str or None: The username that went offline, or None if the sid was
+            unknown or the user still has other connections
+        """
+        return self.registry.remove(sid)
+
+    def is_online(self, username):
+        return self.registry.is_online(username)
+
+    def online_users(self):
+        """Return the usernames of everyone currently connected."""
+        return self.registry.online_users()
+
+    def owns_connection(self, username, sid):
+        """True if the socket id belongs to one of the user's current connections."""
+        return bool(sid) and self.registry.owns(username, sid)
+
+    @property
+    def heartbeat_interval(self):
+        """Seconds between heartbeat() calls, or None if the registry doesn't need them."""
+        return self.registry.heartbeat_interval
+
+    def heartbeat(self):
+        """Keep this worker's connections registered in a shared registry."""
+        self.registry.heartbeat()
+
+    def on_directory_reload(self, listener):
+        """
+        Register a callable run after the directory is reloaded. Listeners are called
+        without the directory lock held, so they may take their own locks and those
+        may in turn be held while calling back into Presence.
+        """
+        self._reload_listeners.append(listener)
+
+    def add_user(self, user_dict):
+        """Add or refresh a user in the cached directory and tell other workers."""
+        with self._lock:
+            directory = self._get_directory()
+            directory[user_dict["username"]] = dict(user_dict)
+            version = self.registry.bump_directory_version()
+            # Our copy already has the user, so only skip the reload if no other change came in between
+            if version == (self._directory_version or 0) + 1 or version == 0:
+                self._directory_version = version
+        self._run_reload_listeners()
+
+    def snapshot(self):
+        """Return every registered user with its is_online flag."""
+        online = set(self.online_users())
+        with self._lock:
+            users = [
+                dict(user, is_online=username in online)
+                for username, user in self._get_directory().items()
+            ]
+        self._run_reload_listeners()
+        return users
+
+    def user(self, username):
+        """Return one user's directory entry with its is_online flag, or None."""
+        with self._lock:
+            user = self._get_directory().get(username)
+        self._run_reload_listeners()
+        return dict(user, is_online=self.is_online(username)) if user else None
+
+    def refresh(self):
+        """Reload the directory if another worker has changed it since it was loaded."""
+        with self._lock:
+            self._get_directory()
+        self._run_reload_listeners()
+
+    def invalidate(self):
+        """Drop the cached directory so it is reloaded on next use."""
+        with self._lock:
+            self._directory = None
+
+    def _get_directory(self):
+        # Caller holds the lock, and calls _run_reload_listeners after releasing it
+        version = self.registry.directory_version()
+        if self._directory is not None and version == self._directory_version:
+            return self._directory
+
+        try:
+            self._directory = {user["username"]: user for user in self._load_directory()}
+            self._directory_version = version
+        except Exception as e:
+            logging.error(f"Error loading user directory: {str(e)}")
+            return self._directory or {}
+
+        self._reload_pending = True
+        return self._directory
+
+    def _run_reload_listeners(self):
+        with self._lock:
+            if not self._reload_pending:
+                return
+            self._reload_pending = False
+        for listener in self._reload_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logging.error(f"Error in directory reload listener: {str(e)}")
+
+def create_presence_registry(backend=None):
+    """
+    Create the connection registry selected by the PRESENCE_REGISTRY environment variable.
+
+    Args:
+        backend: "memory" (default), "redis" (uses REDIS_URL) or "local-kv"; overrides PRESENCE_REGISTRY
+    """
+    backend = (backend or os.getenv("PRESENCE_REGISTRY", "memory")).lower()
+    if backend == "memory":
+        return MemoryPresenceRegistry()
+    if backend == "redis":
+        return KeyValuePresenceRegistry(create_kv_client())
+    if backend == "local-kv":
+        return KeyValuePresenceRegistry(create_kv_client("local://"))
+    raise ValueError(f"Unknown presence registry backend: {backend}")
@@ -0,0 +1,165 @@
+import os
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait as wait_futures
+
+# Timeouts and pool sizes shared by the provider clients
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "30"))
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "5"))
+PROVIDER_POOL_SIZE = int(os.getenv("PROVIDER_POOL_SIZE", "20"))
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+# Native threads for provider calls offloaded from green threads, one per pooled connection by default
+OFFLOAD_THREADS = int(os.getenv("OFFLOAD_THREADS", str(PROVIDER_POOL_SIZE)))
+
+_clients = {}
+_clients_lock = threading.Lock()
+_green_offload = False
+
+def _shared(name, factory):
+    # Build each client once per process and reuse it (and its connection pool)
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def set_client(name, client):
+    """
+    Replace a shared client ("openai", "tts", "deepgram" or "pinecone"), e.g. with a fake
+    for offline benchmarks. Must be called before the modules that use it are imported.
+    """
+    with _clients_lock:
+        _clients[name] = client
+
+def http_timeout():
+    """httpx timeout used for provider HTTP calls."""
+    import httpx
+
+    return httpx.Timeout(PROVIDER_TIMEOUT, connect=PROVIDER_CONNECT_TIMEOUT)
+
+def get_openai_client():
+    """Shared OpenAI client with a bounded keep-alive connection pool and timeouts."""
+    def create():
+        import httpx
+        from openai import OpenAI
+
+        http_client = httpx.Client(
+            timeout=http_timeout(),
+            limits=httpx.Limits(
+                max_connections=PROVIDER_POOL_SIZE,
+                max_keepalive_connections=PROVIDER_POOL_SIZE
+            )
+        )
+        return OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=http_timeout(),
+            max_retries=PROVIDER_MAX_RETRIES,
+            http_client=http_client
+        )
+
+    return _shared("openai", create)
+
+def get_tts_client():
+    """Shared Google Cloud TTS client; its gRPC channel multiplexes concurrent calls."""
+    def create():
+        from google.cloud import texttospeech
+
+        return texttospeech.TextToSpeechClient()
+
+    return _shared("tts", create)
+
+def get_deepgram_client():
+    """Shared Deepgram client."""
+    def create():
+        from deepgram import DeepgramClient
+
+        api_key = os.getenv("DEEPGRAM_API_KEY")
+        if not api_key:
+            raise ValueError("Deepgram API key is missing. Set DEEPGRAM_API_KEY as an environment variable.")
+        return DeepgramClient(api_key=api_key)
+
+    return _shared("deepgram", create)
+
+def get_pinecone_client():
+    """Shared Pinecone client sized to the provider pool."""
+    def create():
+        from pinecone import Pinecone
+
+        return Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=PROVIDER_POOL_SIZE)
+
+    return _shared("pinecone", create)
+
+def enable_green_offload():
+    """
+    Turn on offloading of blocking provider calls for eventlet.
+    The app isn't monkey-patched (gRPC doesn't support it), so a provider call
+    made from a green thread would block the whole hub and every socket on it.
+    Sizes eventlet's native thread pool to OFFLOAD_THREADS; call before the first offload.
+    """
+    global _green_offload
+    from eventlet import tpool
+
+    tpool.set_num_threads(OFFLOAD_THREADS)
+    _green_offload = True
+
+def _in_green_thread():
+    if not _green_offload:
+        return False
+    import greenlet
+
+    # Green threads run under the hub greenlet; native threads (tpool, worker pools) don't
+    return greenlet.getcurrent().parent is not None
+
+def offload(fn, *args, **kwargs):
+    """
+    Call a blocking function without stalling other green threads.
+    From a green thread the call runs on eventlet's native thread pool; from a
+    native thread (or when offloading is off) it is called directly.
+    """
+    if _in_green_thread():
+        from eventlet import tpool
+
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+def _green_poll(ready, timeout):
+    # Sleep between checks so other green threads run; returns whether ready() came true
+    import eventlet
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.001
+    while not ready():
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        eventlet.sleep(delay)
+        delay = min(delay * 2, 0.02)
+    return True
+
+def wait(future, timeout=None):
+    """
+    Wait for a concurrent.futures Future without stalling other green threads.
+    From a green thread the future is polled between eventlet sleeps, so waiting
+    doesn't hold one of the native offload threads.
+    """
+    if future.done() or not _in_green_thread():
+        return future.result(timeout)
+    if not _green_poll(future.done, timeout):
+        raise FutureTimeoutError()
+    return future.result()
+
+def wait_first(fs, timeout=None):
+    """
+    Wait until any of the futures finishes, like concurrent.futures.wait with
+    FIRST_COMPLETED, polling cooperatively from a green thread as wait() does.
+
+    Returns:
+        tuple: (set of done futures, set of not done futures)
+    """
+    fs = list(fs)
+    if not _in_green_thread():
+        return wait_futures(fs, timeout, FIRST_COMPLETED)
+    _green_poll(lambda: any(future.done() for future in fs), timeout)
+    done = {future for future in fs if future.done()}
+    return done, set(fs) - done
@@ -30,6 +30,7 @@ document.addEventListener("DOMContentLoaded", () => {
   let aiRecording = false;
   let aiMediaRecorder;
   let aiAudioChunks = [];
+  let liveSttStreamId = null;
   
   // Conversation state for voice assistant
   let inConversation = false;
@@ -38,6 +39,12 @@ document.addEventListener("DOMContentLoaded", () => {
   // Store unread messages count for each user
   const unreadCounts = {};
   
+  // Sentence audio streamed from the server, keyed by stream id
+  const audioStreams = {};
+  
+  // Known users keyed by username, kept current by presence events
+  let knownUsers = {};
+  
   // Notifications array to store unread messages
   let notifications = [];
   
@@ -159,6 +166,15 @@ document.addEventListener("DOMContentLoaded", () => {
     waveform = document.getElementById("waveform");
     listeningIndicator = document.getElementById("listeningIndicator");
     
+    // Load older messages when scrolled to the top of the conversation
+    if (messagesContainer) {
+      messagesContainer.addEventListener("scroll", () => {
+        if (messagesContainer.scrollTop === 0) {
+          loadOlderChatHistory();
+        }
+      });
+    }
+    
     // Voice UI elements
     const voiceStatus = document.getElementById("voiceStatus");
     const messagePreview = document.getElementById("messagePreview");
@@ -273,11 +289,26 @@ document.addEventListener("DOMContentLoaded", () => {
     // Initial load of all users when page loads
     fetchAllUsers();
     
-    // Update user list when status changes
-    socket.on("user_status_update", (data) => {
+    // Full user directory, sent once when we join
+    socket.on("presence_snapshot", (data) => {
       updateUserList(data.all_users);
     });
     
+    // Single-user presence changes
+    socket.on("presence_delta", (data) => {
+      const existing = knownUsers[data.username];
+      if (existing) {
+        existing.is_online = data.is_online;
+      } else if (data.user) {
+        knownUsers[data.username] = { ...data.user, is_online: data.is_online };
+      } else {
+        // Unknown user without details - fall back to a full refresh
+        fetchAllUsers();
+        return;
+      }
+      renderUserList();
+    });
+    
     // Listen for messages
     socket.on("receive_message", (data) => {
       console.log("Received message:", data);
@@ -351,8 +382,18 @@ document.addEventListener("DOMContentLoaded", () => {
     return unreadCounts[contactName] || 0;
   }
   
-  // Update the user list with online/offline indicators
+  // Replace the known user directory and redraw the contacts list
   function updateUserList(userList) {
+    knownUsers = {};
+    userList.forEach(user => {
+      knownUsers[user.username] = user;
+    });
+    renderUserList();
+  }
+  
+  // Draw the contacts list with online/offline indicators
+  function renderUserList() {
+    const userList = Object.values(knownUsers);
     const contactsContainer = document.getElementById("contacts");
     console.log("Updating user list, contacts container exists:", !!contactsContainer);
     
@@ -429,12 +470,37 @@ document.addEventListener("DOMContentLoaded", () => {
     console.log(`Added ${contactsAdded} contacts to the contacts list`);
   }
   
+  // Cursor for loading older chat history, or null when there is nothing older
+  let historyUser = null;
+  let historyBeforeId = null;
+  let loadingOlderHistory = false;
+  
+  // Fetch one page of chat history; pass a before_id to get older messages
+  function fetchChatHistoryPage(selectedUser, beforeId = null) {
+    const body = { user1: username, user2: selectedUser };
+    if (beforeId !== null) {
+      body.before_id = beforeId;
+    }
+    
+    return fetch("/get_chat_history", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body)
+    })
+    .then(response => {
+      if (!response.ok) throw new Error("Failed to load chat history");
+      return response.json();
+    });
+  }
+  
   // Load chat history
   function loadChatHistory(selectedUser) {
     if (!messagesContainer) return;
     
     // Clear existing messages
     messagesContainer.innerHTML = "";
+    historyUser = selectedUser;
+    historyBeforeId = null;
     
     // Add loading indicator
     const loadingMsg = document.createElement("div");
@@ -442,21 +508,14 @@ document.addEventListener("DOMContentLoaded", () => {
     loadingMsg.classList.add("message-bubble", "system");
     messagesContainer.appendChild(loadingMsg);
     
-    // Fetch message history
-    fetch("/get_chat_history", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ user1: username, user2: selectedUser })
-    })
-    .then(response => {
-      if (!response.ok) throw new Error("Failed to load chat history");
-      return response.json();
-    })
-    .then(messages => {
+    // Fetch the latest page of message history
+    fetchChatHistoryPage(selectedUser)
+    .then(page => {
       // Remove loading message
       messagesContainer.innerHTML = "";
+      historyBeforeId = page.next_before_id;
       
-      if (messages.length === 0) {
+      if (page.messages.length === 0) {
         // Display a "no messages" indicator
         const noMsg = document.createElement("div");
         noMsg.textContent = "No messages yet";
@@ -464,7 +523,7 @@ document.addEventListener("DOMContentLoaded", () => {
         messagesContainer.appendChild(noMsg);
       } else {
         // Display each message
-        messages.forEach(message => {
+        page.messages.forEach(message => {
           displayMessage(message);
         });
       }
@@ -483,6 +542,32 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
   
+  // Load the page of messages before the oldest one shown, keeping the scroll position
+  function loadOlderChatHistory() {
+    if (!messagesContainer || historyBeforeId === null || loadingOlderHistory) return;
+    
+    const selectedUser = historyUser;
+    loadingOlderHistory = true;
+    fetchChatHistoryPage(selectedUser, historyBeforeId)
+    .then(page => {
+      // Ignore the page if another conversation was opened meanwhile
+      if (selectedUser !== historyUser) return;
+      historyBeforeId = page.next_before_id;
+      
+      const previousHeight = messagesContainer.scrollHeight;
+      const firstChild = messagesContainer.firstChild;
+      page.messages.forEach(message => {
+        const msgDiv = displayMessage(message);
+        messagesContainer.insertBefore(msgDiv, firstChild);
+      });
+      messagesContainer.scrollTop = messagesContainer.scrollHeight - previousHeight;
+    })
+    .catch(error => console.error("Error loading older messages:", error))
+    .finally(() => {
+      loadingOlderHistory = false;
+    });
+  }
+  
   // Display messages with a slight delay between each for better UX
   function displayMessagesWithDelay(messages, index) {
     if (index >= messages.length) {
@@ -603,13 +688,17 @@ document.addEventListener("DOMContentLoaded", () => {
   }
   
   // Function to process audio blob and send to server
-  async function processAudio(audioBlob) {
-    if (!audioBlob) return;
+  async function processAudio(audioBlob, sttStreamId) {
+    if (!audioBlob && !sttStreamId) return;
 
     try {
-        // Create a FormData object to send the audio
+        // Send the live transcription stream id, or the recording itself
         const formData = new FormData();
-        formData.append('file', audioBlob, 'recording.wav');
+        if (sttStreamId) {
+            formData.append('stt_stream_id', sttStreamId);
+        } else {
+            formData.append('file', audioBlob, 'recording.wav');
+        }
 
         // Get the username
         const username = getUsername();
@@ -625,6 +714,10 @@ document.addEventListener("DOMContentLoaded", () => {
         
         // Add voice gender preference
         formData.append('voice_gender', localStorage.getItem('ttsVoice') || 'FEMALE');
+        
+        // Ask for the reply audio to be streamed sentence by sentence over the socket
+        formData.append('stream_audio', socket.connected ? 'true' : 'false');
+        formData.append('socket_id', socket.id || '');
 
         // Update voice status
         updateVoiceStatus("Processing your message...");
@@ -663,7 +756,13 @@ document.addEventListener("DOMContentLoaded", () => {
         updateVoiceStatus(`You said: "${data.transcript}"`);
 
         // Play the audio response if available
-        if (data.audio_response) {
+        if (data.audio_stream_id) {
+            // Chunks may already be playing; wait for the last one to finish
+            await waitForAudioStream(data.audio_stream_id);
+            
+            // Update voice status with the AI response after audio plays
+            updateVoiceStatus(data.response);
+        } else if (data.audio_response) {
             // Convert base64 to audio and play it
             const audio = new Audio(`data:audio/mp3;base64,${data.audio_response}`);
             await audio.play();
@@ -761,6 +860,120 @@ document.addEventListener("DOMContentLoaded", () => {
     }
 }
   
+  // Get or create the playback state for a streamed audio reply
+  function getAudioStream(streamId) {
+    if (!audioStreams[streamId]) {
+      audioStreams[streamId] = {
+        chunks: {},
+        nextIndex: 0,
+        total: null,
+        playing: false,
+        ended: false,
+        done: false,
+        onDone: null
+      };
+    }
+    return audioStreams[streamId];
+  }
+  
+  // Play streamed chunks in order, starting as soon as the first one arrives
+  function playNextAudioChunk(streamId) {
+    const stream = audioStreams[streamId];
+    if (!stream || stream.playing || stream.done) return;
+    
+    const chunk = stream.chunks[stream.nextIndex];
+    const finished = stream.total !== null && stream.nextIndex >= stream.total;
+    
+    // Chunks missing after the end event were never synthesized; stop there
+    if (finished || (!chunk && stream.ended)) {
+      stream.done = true;
+      if (stream.onDone) {
+        delete audioStreams[streamId];
+        stream.onDone();
+      }
+      return;
+    }
+    
+    if (!chunk) return;
+    
+    delete stream.chunks[stream.nextIndex];
+    stream.nextIndex += 1;
+    stream.playing = true;
+    
+    const audio = new Audio(`data:audio/mp3;base64,${chunk.audio}`);
+    const next = () => {
+      stream.playing = false;
+      playNextAudioChunk(streamId);
+    };
+    audio.onended = next;
+    audio.onerror = next;
+    audio.play().catch(next);
+  }
+  
+  // Resolve once every chunk of a streamed reply has played
+  function waitForAudioStream(streamId) {
+    return new Promise(resolve => {
+      const stream = getAudioStream(streamId);
+      if (stream.done) {
+        // Playback finished before the HTTP response arrived
+        delete audioStreams[streamId];
+        resolve();
+        return;
+      }
+      stream.onDone = resolve;
+      playNextAudioChunk(streamId);
+    });
+  }
+  
+  socket.on("tts_chunk", (data) => {
+    const stream = getAudioStream(data.stream_id);
+    stream.chunks[data.index] = data;
+    stream.total = data.total;
+    playNextAudioChunk(data.stream_id);
+  });
+  
+  // Start a live transcription stream; resolves to its id, or null to fall back to uploading
+  function startLiveTranscription() {
+    return new Promise((resolve) => {
+      if (!socket.connected) {
+        resolve(null);
+        return;
+      }
+      socket.timeout(3000).emit("stt_start", { username: getUsername() }, (err, response) => {
+        resolve(!err && response && response.stream_id ? response.stream_id : null);
+      });
+    });
+  }
+  
+  // Finish a live transcription stream; resolves to the final transcript result, or null
+  function stopLiveTranscription(streamId) {
+    return new Promise((resolve) => {
+      socket.timeout(10000).emit("stt_stop", { stream_id: streamId }, (err, response) => {
+        resolve(!err && response && !response.error ? response : null);
+      });
+    });
+  }
+  
+  // Show a streamed reply as the model writes it
+  const replyDrafts = {};
+  socket.on("reply_delta", (data) => {
+    replyDrafts[data.stream_id] = (replyDrafts[data.stream_id] || "") + data.text;
+    updateVoiceStatus(replyDrafts[data.stream_id]);
+  });
+  
+  socket.on("stt_partial", (data) => {
+    if (data.text) {
+        updateVoiceStatus(`Hearing: "${data.text}"`);
+    }
+  });
+  
+  socket.on("tts_stream_end", (data) => {
+    delete replyDrafts[data.stream_id];
+    const stream = getAudioStream(data.stream_id);
+    stream.ended = true;
+    playNextAudioChunk(data.stream_id);
+  });
+  
   // Update the voice status display
   function updateVoiceStatus(message) {
     const voiceStatus = document.getElementById('voiceStatus');
@@ -933,14 +1146,20 @@ document.addEventListener("DOMContentLoaded", () => {
         updateVoiceStatus("Listening...");
         
         navigator.mediaDevices.getUserMedia({ audio: true })
-        .then((stream) => {
+        .then(async (stream) => {
             aiMediaRecorder = new MediaRecorder(stream);
-            aiMediaRecorder.start();
-            aiRecording = true;
             aiAudioChunks = [];
             
+            // Stream the audio in small chunks for live transcription when available
+            liveSttStreamId = await startLiveTranscription();
+            aiMediaRecorder.start(liveSttStreamId ? 250 : undefined);
+            aiRecording = true;
+            
             aiMediaRecorder.addEventListener("dataavailable", (event) => {
                 aiAudioChunks.push(event.data);
+                if (liveSttStreamId && event.data.size > 0) {
+                    socket.emit("stt_audio", { stream_id: liveSttStreamId, audio: event.data });
+                }
             });
             
             aiMediaRecorder.addEventListener("stop", () => {
@@ -959,7 +1178,16 @@ document.addEventListener("DOMContentLoaded", () => {
                 
                 // Create a Blob from recorded chunks
                 const audioBlob = new Blob(aiAudioChunks, { type: "audio/webm" });
-                processAudio(audioBlob);
+                if (liveSttStreamId) {
+                    // The transcript is ready on the server; upload the recording only if streaming failed
+                    const streamId = liveSttStreamId;
+                    liveSttStreamId = null;
+                    stopLiveTranscription(streamId).then((result) => {
+                        processAudio(result ? null : audioBlob, result ? streamId : null);
+                    });
+                } else {
+                    processAudio(audioBlob);
+                }
             });
         })
         .catch(err => {
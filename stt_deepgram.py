@@ -1,21 +1,15 @@
-import os
 import io
-from deepgram import DeepgramClient, PrerecordedOptions
+from deepgram import PrerecordedOptions
+from provider_clients import get_deepgram_client, http_timeout, offload
 
-# Load API key
-DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
-
-if not DEEPGRAM_API_KEY:
-    raise ValueError("Deepgram API key is missing. Set DEEPGRAM_API_KEY as an environment variable.")
-
-# Initialize Deepgram client
-deepgram = DeepgramClient(api_key=DEEPGRAM_API_KEY)
+# Shared Deepgram client (raises if DEEPGRAM_API_KEY is missing)
+deepgram = get_deepgram_client()
 
 def transcribe_audio(audio_bytes, model="nova-2") -> str:
     """
     Transcribes audio using Deepgram API.
 
-    :param audio_bytes: Audio file as BytesIO or bytes
+    :param audio_bytes: Audio as bytes or a binary file-like object (BytesIO, upload stream)
     :param model: Deepgram model to use (nova-2 or nova-3)
     :return: Transcribed text or an error message
     """
@@ -37,11 +31,16 @@ def transcribe_audio(audio_bytes, model="nova-2") -> str:
             audio_bytes.seek(0)
             
         # Get the actual bytes depending on the input type
-        audio_data = audio_bytes.getvalue() if isinstance(audio_bytes, io.BytesIO) else audio_bytes
+        if isinstance(audio_bytes, io.BytesIO):
+            audio_data = audio_bytes.getvalue()
+        elif hasattr(audio_bytes, 'read'):
+            audio_data = audio_bytes.read()
+        else:
+            audio_data = audio_bytes
         
         # Prepare payload and send to Deepgram
         payload = {'buffer': audio_data, 'mimetype': 'audio/wav'}
-        response = deepgram.listen.rest.v("1").transcribe_file(payload, options)
+        response = offload(deepgram.listen.rest.v("1").transcribe_file, payload, options, timeout=http_timeout())
         
         # Extract transcript
         transcript = response.results.channels[0].alternatives[0].transcript
@@ -0,0 +1,219 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent import futures
+from provider_clients import wait_first
+from metrics import metrics
+
+class ProviderStats:
+    """Rolling latency and error record of one STT provider."""
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.last_failure = None
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((latency, ok))
+            if not ok:
+                self.last_failure = time.monotonic()
+
+    def latency_percentile(self, percentile):
+        """Latency in seconds of successful calls at a percentile, or None without samples."""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def error_rate(self):
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def __len__(self):
+        return len(self._samples)
+
+class STTRouter:
+    """
+    Routes transcriptions between speech-to-text providers.
+    Each request goes to the healthy provider with the lowest median latency. If it
+    hasn't answered by that provider's p95 latency, a hedged request goes to the
+    next provider and whichever succeeds first wins. Failed calls fail over to the
+    remaining providers in order.
+    """
+
+    def __init__(self, providers, max_workers=8, hedging=True, hedge_min_delay=0.5, hedge_default_delay=2.0,
+                 hedge_percentile=95, max_error_rate=0.5, min_samples=5, cooldown=30, window=100):
+        """
+        Args:
+            providers: Dict of name -> function(audio, filename) returning the transcript,
+                in order of preference while there is no latency data
+            max_workers: Threads for provider calls
+            hedging: Send a second request when the first is slow
+            hedge_min_delay: Minimum seconds before hedging
+            hedge_default_delay: Seconds before hedging while the provider has too few samples
+            hedge_percentile: Latency percentile of the primary provider that triggers the hedge
+            max_error_rate: Error rate over the window above which a provider is unhealthy
+            min_samples: Calls needed before latency and error rates are trusted
+            cooldown: Seconds after its last failure before an unhealthy provider is retried
+            window: Number of recent calls kept per provider
+        """
+        if not providers:
+            raise ValueError("At least one STT provider is required")
+        self.providers = dict(providers)
+        self.hedging = hedging
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_percentile = hedge_percentile
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._stats = {name: ProviderStats(window) for name in self.providers}
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stt")
+        self._counters_lock = threading.Lock()
+        self._counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def is_healthy(self, name):
+        stats = self._stats[name]
+        if len(stats) < self.min_samples or stats.error_rate() < self.max_error_rate:
+            return True
+        # Let an unhealthy provider take a request again once it has cooled down
+        return stats.last_failure is None or time.monotonic() - stats.last_failure > self.cooldown
+
+    def ranked(self):
+        """Provider names, healthy ones first, each group by median latency."""
+        order = list(self.providers)
+
+        def sort_key(name):
+            median = self._stats[name].latency_percentile(50)
+            # Providers without data sort by preference ahead of measured ones, so they get tried
+            return (not self.is_healthy(name), median if median is not None else 0.0, order.index(name))
+
+        return sorted(order, key=sort_key)
+
+    def hedge_delay(self, name):
+        stats = self._stats[name]
+        if len(stats) < self.min_samples:
+            return self.hedge_default_delay
+        latency = stats.latency_percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, latency if latency is not None else self.hedge_default_delay)
+
+    def _call(self, name, audio, filename):
+        start = time.monotonic()
+        try:
+            with metrics.span("stt", name, "transcribe"):
+                transcript = self.providers[name](audio, filename)
+        except Exception:
+            self._stats[name].record(time.monotonic() - start, False)
+            raise
+        self._stats[name].record(time.monotonic() - start, True)
+        return transcript
+
+    def _submit(self, name, audio, filename):
+        # Provider calls run on the router's threads but count toward the request's trace
+        return self._executor.submit(contextvars.copy_context().run, self._call, name, audio, filename)
+
+    def transcribe(self, audio, filename="recording.wav"):
+        """
+        Transcribe audio with the best available provider.
+        Hedged requests need the audio as bytes; file-like audio is only failed over.
+
+        Returns:
+            tuple: (transcript, name of the provider that produced it)
+        """
+        self._count("requests")
+        remaining = self.ranked()
+        errors = []
+        can_hedge = self.hedging and isinstance(audio, (bytes, bytearray))
+
+        while remaining:
+            primary = remaining.pop(0)
+            if hasattr(audio, 'seek'):
+                audio.seek(0)
+            pending = {self._submit(primary, audio, filename): primary}
+
+            if can_hedge and remaining:
+                done, _ = wait_first(pending, self.hedge_delay(primary))
+                if not done:
+                    hedge = remaining.pop(0)
+                    logging.info(f"STT provider {primary} is slow, hedging with {hedge}")
+                    self._count("hedged")
+                    pending[self._submit(hedge, audio, filename)] = hedge
+
+            while pending:
+                done, _ = wait_first(pending)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        transcript = future.result()
+                    except Exception as e:
+                        logging.warning(f"STT provider {name} failed: {str(e)}")
+                        errors.append(f"{name}: {str(e)}")
+                        continue
+                    if name != primary:
+                        self._count("hedge_wins")
+                    return transcript, name
+
+            if remaining:
+                self._count("failovers")
+
+        raise RuntimeError("All STT providers failed: " + "; ".join(errors))
+
+    def stats(self):
+        """Return per-provider latency and error rates and routing counters."""
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats["providers"] = {
+            name: {
+                "samples": len(provider_stats),
+                "p50": provider_stats.latency_percentile(50),
+                "p95": provider_stats.latency_percentile(95),
+                "error_rate": provider_stats.error_rate(),
+                "healthy": self.is_healthy(name)
+            }
+            for name, provider_stats in self._stats.items()
+        }
+        return stats
+
+def deepgram_provider(audio, filename):
+    """Adapt stt_deepgram.transcribe_audio, which reports errors as text, to raise instead."""
+    from stt_deepgram import transcribe_audio
+
+    transcript = transcribe_audio(audio)
+    if transcript.startswith("Error in Deepgram STT"):
+        raise RuntimeError(transcript)
+    return "" if transcript == "No speech detected." else transcript
+
+def create_stt_router(whisper):
+    """
+    Create the router over the providers listed in STT_PROVIDERS (default "whisper,deepgram").
+    Deepgram is only included when DEEPGRAM_API_KEY is set.
+
+    Args:
+        whisper: The Whisper transcription function, taking (audio, filename)
+    """
+    available = {"whisper": whisper}
+    if os.getenv("DEEPGRAM_API_KEY"):
+        available["deepgram"] = deepgram_provider
+
+    names = [name.strip() for name in os.getenv("STT_PROVIDERS", "whisper,deepgram").split(",") if name.strip()]
+    providers = {name: available[name] for name in names if name in available}
+    if not providers:
+        providers = {"whisper": whisper}
+
+    return STTRouter(
+        providers,
+        hedging=os.getenv("STT_HEDGING", "true").lower() == "true",
+        hedge_min_delay=float(os.getenv("STT_HEDGE_MIN_DELAY", "0.5"))
+    )
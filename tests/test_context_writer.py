@@ -0,0 +1,54 @@
+import os
+import threading
+
+# Importing the writer builds the shared clients; nothing here reaches a provider
+os.environ.setdefault("VECTOR_STORE", "numpy")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from context_writer import ContextWriteBehind
+
+class BlockingWriter:
+    """Records written messages; blocks the first write until released."""
+
+    def __init__(self):
+        self.messages = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, updates):
+        self.started.set()
+        self.release.wait(5)
+        for _, messages, _ in updates:
+            self.messages.extend(messages)
+
+def test_overflow_is_written_after_older_queued_messages():
+    writer = BlockingWriter()
+    context_writer = ContextWriteBehind(writer=writer, max_queue_size=5, max_batch_size=2)
+
+    # The first write blocks, so later messages fill the queue and then the overflow
+    context_writer.submit("alice_bob", "m0", ["alice", "bob"])
+    assert writer.started.wait(5)
+    for i in range(1, 10):
+        context_writer.submit("alice_bob", f"m{i}", ["alice", "bob"])
+    assert context_writer.stats()["overflowed"] > 0
+
+    writer.release.set()
+    assert context_writer.flush(timeout=5)
+    assert writer.messages == [f"m{i}" for i in range(10)]
+
+def test_messages_after_overflow_keep_their_order():
+    writer = BlockingWriter()
+    context_writer = ContextWriteBehind(writer=writer, max_queue_size=4, max_batch_size=1)
+
+    context_writer.submit("alice_bob", "m0", ["alice", "bob"])
+    assert writer.started.wait(5)
+    for i in range(1, 6):
+        context_writer.submit("alice_bob", f"m{i}", ["alice", "bob"])
+    # Submitted while the worker catches up, with the overflow still pending
+    writer.release.set()
+    for i in range(6, 9):
+        context_writer.submit("alice_bob", f"m{i}", ["alice", "bob"])
+
+    assert context_writer.flush(timeout=5)
+    assert writer.messages == [f"m{i}" for i in range(9)]
+    assert context_writer.stats()["overflow_dropped"] == 0
@@ -0,0 +1,71 @@
+import threading
+from contact_index import ContactIndex
+from kv_store import LocalKeyValueClient
+from presence import KeyValuePresenceRegistry, Presence
+
+USERS = [{"username": "alice"}, {"username": "bob"}]
+
+class GatedDirectory:
+    """User directory whose next load waits until the contact index is being loaded."""
+
+    def __init__(self):
+        self.index_locked = threading.Event()
+        self.armed = False
+
+    def arm(self):
+        self.index_locked.clear()
+        self.armed = True
+
+    def __call__(self):
+        if self.armed:
+            self.armed = False
+            self.index_locked.wait(5)
+        return list(USERS)
+
+def make_worker(client, directory):
+    presence = Presence(directory, registry=KeyValuePresenceRegistry(client))
+
+    def load_names():
+        # Holds the index lock while reading the directory, like app.contact_index
+        directory.index_locked.set()
+        return [user["username"] for user in presence.snapshot()]
+
+    index = ContactIndex(load_names=load_names)
+    presence.on_directory_reload(index.invalidate)
+    return presence, index
+
+def race(presence, index):
+    # A directory reload and a contact index load racing each other
+    threads = [
+        threading.Thread(target=presence.snapshot, daemon=True),
+        threading.Thread(target=index.lookup, args=("bob",), daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return [thread for thread in threads if thread.is_alive()]
+
+def test_cold_start_directory_and_index_loads_do_not_deadlock():
+    directory = GatedDirectory()
+    presence, index = make_worker(LocalKeyValueClient(), directory)
+
+    directory.arm()
+    assert race(presence, index) == []
+    assert index.lookup("bob") == "bob"
+
+def test_reload_after_another_worker_registers_does_not_deadlock():
+    client = LocalKeyValueClient()
+    directory = GatedDirectory()
+    presence, index = make_worker(client, directory)
+    other, _ = make_worker(client, GatedDirectory())
+    assert index.lookup("bob") == "bob"
+
+    # Another worker registers a user, so this worker reloads and drops its index
+    other.add_user({"username": "carol"})
+    presence.refresh()
+    other.add_user({"username": "dave"})
+
+    directory.arm()
+    assert race(presence, index) == []
+    assert index.lookup("alice") == "alice"
@@ -0,0 +1,219 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+class TTSCache:
+    """
+    Two-tier content-addressed cache for synthesized speech.
+    Audio is kept in an in-memory LRU bounded by a byte budget and, when a
+    directory is configured, mirrored to disk so it survives restarts. The disk
+    tier is an LRU with its own byte budget, indexed in memory and rebuilt from
+    file modification times on startup.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        """
+        :param max_bytes: Byte budget for the in-memory tier
+        :param disk_dir: Directory for the on-disk tier, or None to disable it
+        :param disk_max_bytes: Byte budget for the on-disk tier
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_entries = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(text, voice_name, audio_encoding, **audio_config):
+        """
+        Build the cache key from everything that affects the synthesized audio.
+
+        :param text: Text being synthesized
+        :param voice_name: Google voice name
+        :param audio_encoding: Audio encoding name (MP3 or OGG_OPUS)
+        :param audio_config: Remaining AudioConfig fields (speaking_rate, pitch, ...)
+        :return: Hex digest identifying the audio
+        """
+        config = ";".join(f"{name}={audio_config[name]}" for name in sorted(audio_config))
+        raw = "\x1f".join([text, voice_name, audio_encoding.upper(), config])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Look up audio bytes, checking memory first and then disk.
+
+        :param key: Key from make_key
+        :return: Audio bytes, or None on a miss
+        """
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        audio = self._read_disk(key)
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory(key, audio)
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+        self._touch_disk(key)
+        return audio
+
+    def put(self, key, audio):
+        """
+        Store audio bytes in both tiers.
+
+        :param key: Key from make_key
+        :param audio: Raw audio bytes
+        """
+        with self._lock:
+            self._put_memory(key, audio)
+        self._write_disk(key, audio)
+
+    def clear(self):
+        """Drop the in-memory tier (the disk tier is left in place)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current memory and disk usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_evictions": self.disk_evictions,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes
+            }
+
+    def _put_memory(self, key, audio):
+        # Caller holds the lock
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = audio
+        self._bytes += len(audio)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _load_disk_index(self):
+        # Least recently used first, by modification time (reads touch their file)
+        found = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, name, stat.st_size))
+        found.sort()
+        with self._lock:
+            for _, key, size in found:
+                self._disk_entries[key] = size
+                self._disk_bytes += size
+            stale = self._prune_disk()
+        self._remove_disk(stale)
+
+    def _prune_disk(self):
+        # Caller holds the lock; returns the keys whose files should be removed
+        stale = []
+        while self._disk_bytes > self.disk_max_bytes and self._disk_entries:
+            key, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+            stale.append(key)
+        return stale
+
+    def _remove_disk(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Error removing TTS cache entry: {str(e)}")
+
+    def _forget_disk(self, key):
+        with self._lock:
+            size = self._disk_entries.pop(key, None)
+            if size is not None:
+                self._disk_bytes -= size
+
+    def _touch_disk(self, key):
+        try:
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Pruned, possibly by another process sharing the directory
+            self._forget_disk(key)
+            return None
+        except OSError as e:
+            logging.error(f"Error reading TTS cache entry: {str(e)}")
+            return None
+
+    def _write_disk(self, key, audio):
+        if not self.disk_dir or len(audio) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(audio)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.error(f"Error writing TTS cache entry: {str(e)}")
+            return
+
+        with self._lock:
+            previous = self._disk_entries.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous
+            self._disk_entries[key] = len(audio)
+            self._disk_bytes += len(audio)
+            stale = self._prune_disk()
+        self._remove_disk(stale)
@@ -1,8 +1,20 @@
+import os
+import re
 import base64
 from google.cloud import texttospeech
+from tts_cache import TTSCache
+from provider_clients import get_tts_client, offload, wait, PROVIDER_TIMEOUT
+from metrics import metrics
 
-# Initialize the Google Cloud TTS client
-tts_client = texttospeech.TextToSpeechClient()
+# Shared Google Cloud TTS client
+tts_client = get_tts_client()
+
+# Cache of synthesized audio, keyed by text, voice and audio config
+tts_cache = TTSCache(
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    disk_dir=os.getenv("TTS_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("TTS_CACHE_DIR_MAX_BYTES", str(512 * 1024 * 1024)))
+)
 
 # Define specific voice names for English
 LANGUAGE_VOICES = {
@@ -14,6 +26,92 @@ GENDER_INDICES = {
     'FEMALE': 1
 }
 
+# Sentence boundary used to chunk replies for streaming synthesis
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+def split_into_sentences(text: str, min_chars: int = 12) -> list:
+    """
+    Splits text into sentences for chunked synthesis.
+    Fragments shorter than min_chars are merged into the following sentence
+    so very short utterances don't each pay for a separate TTS call.
+
+    :param text: Text to split
+    :param min_chars: Minimum length of a chunk
+    :return: List of sentence strings
+    """
+    sentences = []
+    pending = ""
+    for part in SENTENCE_BOUNDARY.split(text.strip()):
+        if not part:
+            continue
+        pending = f"{pending} {part}".strip()
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+class SentenceBuffer:
+    """
+    Splits text arriving in pieces (e.g. streamed LLM tokens) into sentences for
+    synthesis, using the same boundaries and minimum length as split_into_sentences.
+    """
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self._text = ""
+        self._pending = ""
+
+    def feed(self, delta: str) -> list:
+        """
+        Add text and return the sentences it completed.
+
+        :param delta: The next piece of text
+        :return: List of complete sentence strings
+        """
+        self._text += delta
+        parts = SENTENCE_BOUNDARY.split(self._text)
+        # The last part may still be growing
+        self._text = parts.pop()
+        sentences = []
+        for part in parts:
+            if not part.strip():
+                continue
+            self._pending = f"{self._pending} {part.strip()}".strip()
+            if len(self._pending) >= self.min_chars:
+                sentences.append(self._pending)
+                self._pending = ""
+        return sentences
+
+    def flush(self) -> list:
+        """Return whatever text is left as a final sentence."""
+        rest = f"{self._pending} {self._text.strip()}".strip()
+        self._text = ""
+        self._pending = ""
+        return [rest] if rest else []
+
+def synthesize_sentences(sentences: list, executor, language_code="en-US", voice_gender="FEMALE", audio_encoding="MP3"):
+    """
+    Synthesizes sentences in parallel and yields them in order as they become ready.
+
+    :param sentences: Sentences from split_into_sentences
+    :param executor: concurrent.futures executor used for the TTS calls
+    :param language_code: Language code (only en-US supported)
+    :param voice_gender: Gender of voice (MALE or FEMALE)
+    :param audio_encoding: Audio encoding format (MP3 or OGG_OPUS)
+    :return: Generator of (index, sentence, base64 audio) tuples
+    """
+    futures = [
+        executor.submit(text_to_speech, sentence, language_code, voice_gender, audio_encoding)
+        for sentence in sentences
+    ]
+    for index, (sentence, future) in enumerate(zip(sentences, futures)):
+        yield index, sentence, wait(future)
+
 def text_to_speech(text: str, language_code="en-US", voice_gender="FEMALE", audio_encoding="MP3") -> str:
     """
     Converts input text to speech using Google Cloud TTS with specific voice names.
@@ -51,21 +149,36 @@ def text_to_speech(text: str, language_code="en-US", voice_gender="FEMALE", audi
         else:
             audio_enc = texttospeech.AudioEncoding.MP3
 
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=audio_enc,
-            speaking_rate=1.0,
-            pitch=0.0,
-            volume_gain_db=0.0
-        )
+        audio_settings = {
+            "speaking_rate": 1.0,
+            "pitch": 0.0,
+            "volume_gain_db": 0.0
+        }
 
-        response = tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
+        # Identical phrases are served from the cache instead of re-synthesized
+        cache_key = TTSCache.make_key(text, voice_name, audio_enc.name, **audio_settings)
+        audio_content = tts_cache.get(cache_key)
+
+        if audio_content is None:
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=audio_enc,
+                **audio_settings
+            )
+
+            # gRPC isn't green-safe, so the call runs off the eventlet hub
+            with metrics.span("tts", "google", "synthesize"):
+                response = offload(
+                    tts_client.synthesize_speech,
+                    input=synthesis_input,
+                    voice=voice,
+                    audio_config=audio_config,
+                    timeout=PROVIDER_TIMEOUT
+                )
+            audio_content = response.audio_content
+            tts_cache.put(cache_key, audio_content)
 
         # Return the audio content encoded in base64 so it can be sent in JSON
-        return base64.b64encode(response.audio_content).decode('utf-8')
+        return base64.b64encode(audio_content).decode('utf-8')
     
     except Exception as e:
         return f"Error in tts_google_cloud: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,291 @@
+import os
+import logging
+import threading
+from provider_clients import get_pinecone_client, offload
+from metrics import metrics
+
+# Embedding dimension of text-embedding-ada-002
+EMBEDDING_DIMENSION = 1536
+
+class VectorStore:
+    """
+    Interface for the conversation context vector store.
+    Matches are returned as {"id", "score", "metadata"} dicts and metadata as plain dicts,
+    so callers don't depend on a particular client's response objects.
+    """
+
+    def upsert(self, records):
+        """
+        Insert or replace vectors.
+
+        Args:
+            records: List of (id, values, metadata) tuples
+        """
+        raise NotImplementedError
+
+    def query(self, vector, top_k, filter=None):
+        """
+        Find the most similar vectors by cosine similarity.
+
+        Args:
+            vector: Query embedding
+            top_k: Number of matches to return
+            filter: Optional Pinecone-style metadata filter
+
+        Returns:
+            list: Matches ordered by descending score
+        """
+        raise NotImplementedError
+
+    def fetch(self, ids):
+        """
+        Get the metadata of vectors by id.
+
+        Returns:
+            dict: Maps each id that exists to its metadata
+        """
+        raise NotImplementedError
+
+    def list_ids(self, prefix=None, batch_size=100):
+        """
+        Iterate over stored vector ids a page at a time.
+
+        Returns:
+            Iterator of lists of ids
+        """
+        raise NotImplementedError
+
+    def update_metadata(self, vector_id, metadata):
+        """Merge metadata fields into an existing vector."""
+        raise NotImplementedError
+
+class PineconeVectorStore(VectorStore):
+    """Vector store backed by a Pinecone serverless index."""
+
+    def __init__(self, index_name="conversation-contexts", dimension=EMBEDDING_DIMENSION):
+        from pinecone import ServerlessSpec
+
+        # Shared Pinecone client
+        self.pc = get_pinecone_client()
+        self.index_name = index_name
+
+        # Ensure the index exists
+        if index_name not in self.pc.list_indexes().names():
+            self.pc.create_index(
+                name=index_name,
+                dimension=dimension,
+                metric="cosine",
+                spec=ServerlessSpec(
+                    cloud="aws",
+                    region="us-east-1"
+                )
+            )
+
+        self.index = self.pc.Index(index_name)
+
+    @metrics.timed("vector_store", "pinecone", "upsert")
+    def upsert(self, records):
+        # Metadata travels with the vector so it can be filtered and returned by queries
+        offload(self.index.upsert, vectors=list(records))
+
+    @metrics.timed("vector_store", "pinecone", "query")
+    def query(self, vector, top_k, filter=None):
+        query_args = {}
+        if filter:
+            query_args["filter"] = filter
+        response = offload(
+            self.index.query,
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            **query_args
+        )
+        return [
+            {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+            for match in (getattr(response, 'matches', None) or [])
+        ]
+
+    @metrics.timed("vector_store", "pinecone", "fetch")
+    def fetch(self, ids):
+        response = offload(self.index.fetch, ids=list(ids))
+        vectors = getattr(response, 'vectors', None) or {}
+        return {
+            vector_id: getattr(vector, 'metadata', None) or {}
+            for vector_id, vector in vectors.items()
+        }
+
+    def list_ids(self, prefix=None, batch_size=100):
+        list_args = {"limit": batch_size}
+        if prefix:
+            list_args["prefix"] = prefix
+        pages = self.index.list(**list_args)
+        while True:
+            # Each page is a round trip, timed on its own
+            with metrics.span("vector_store", "pinecone", "list"):
+                page = next(pages, None)
+            if page is None:
+                return
+            yield list(page)
+
+    @metrics.timed("vector_store", "pinecone", "update")
+    def update_metadata(self, vector_id, metadata):
+        offload(self.index.update, id=vector_id, set_metadata=metadata)
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store for small and medium deployments and offline runs.
+    Vectors are kept L2-normalized in one contiguous float32 matrix, so a cosine
+    top-k query is a single matrix-vector product plus argpartition.
+    """
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION, initial_capacity=1024):
+        import numpy as np
+
+        self._np = np
+        self.dimension = dimension
+        self._matrix = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        self._conversation_ids = np.empty(initial_capacity, dtype=object)
+        self._ids = []
+        self._rows = {}
+        self._metadata = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _grow(self, needed):
+        np = self._np
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        matrix = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        matrix[:capacity] = self._matrix
+        conversation_ids = np.empty(new_capacity, dtype=object)
+        conversation_ids[:capacity] = self._conversation_ids
+        self._matrix = matrix
+        self._conversation_ids = conversation_ids
+
+    def _normalize(self, values):
+        np = self._np
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Expected a vector of dimension {self.dimension}, got {vector.shape}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def upsert(self, records):
+        # Validate every record before touching the store, so a bad one leaves it unchanged
+        prepared = [
+            (vector_id, self._normalize(values), dict(metadata or {}))
+            for vector_id, values, metadata in records
+        ]
+        with self._lock:
+            self._grow(len(self._ids) + len(prepared))
+            for vector_id, vector, metadata in prepared:
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[vector_id] = row
+                    self._ids.append(vector_id)
+                    self._metadata.append(metadata)
+                self._matrix[row] = vector
+                self._metadata[row] = metadata
+                self._conversation_ids[row] = metadata.get("conversation_id")
+
+    def _filter_mask(self, filter, count):
+        np = self._np
+        mask = np.ones(count, dtype=bool)
+        for field, condition in filter.items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if field == "conversation_id" and operator == "$eq":
+                    # Vectorized comparison for the common per-conversation scope
+                    mask &= self._conversation_ids[:count] == value
+                    continue
+                mask &= np.fromiter(
+                    (_matches(self._metadata[row].get(field), operator, value) for row in range(count)),
+                    dtype=bool,
+                    count=count
+                )
+        return mask
+
+    def query(self, vector, top_k, filter=None):
+        np = self._np
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or top_k <= 0:
+                return []
+
+            scores = self._matrix[:count] @ self._normalize(vector)
+            if filter:
+                candidates = np.flatnonzero(self._filter_mask(filter, count))
+                if candidates.size == 0:
+                    return []
+                scores = scores[candidates]
+            else:
+                candidates = None
+
+            k = min(top_k, scores.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            rows = candidates[top] if candidates is not None else top
+
+            return [
+                {"id": self._ids[row], "score": float(scores[i]), "metadata": dict(self._metadata[row])}
+                for i, row in zip(top, rows)
+            ]
+
+    def fetch(self, ids):
+        with self._lock:
+            return {
+                vector_id: dict(self._metadata[self._rows[vector_id]])
+                for vector_id in ids
+                if vector_id in self._rows
+            }
+
+    def list_ids(self, prefix=None, batch_size=100):
+        with self._lock:
+            ids = [vector_id for vector_id in self._ids if not prefix or vector_id.startswith(prefix)]
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+    def update_metadata(self, vector_id, metadata):
+        with self._lock:
+            row = self._rows.get(vector_id)
+            if row is None:
+                return
+            self._metadata[row].update(metadata)
+            self._conversation_ids[row] = self._metadata[row].get("conversation_id")
+
+def _matches(field_value, operator, value):
+    """Evaluate one Pinecone-style filter condition against a metadata value."""
+    values = field_value if isinstance(field_value, list) else [field_value]
+    if operator == "$eq":
+        return value in values
+    if operator == "$ne":
+        return value not in values
+    if operator == "$in":
+        return any(item in value for item in values)
+    if operator == "$nin":
+        return not any(item in value for item in values)
+    logging.warning(f"Unsupported filter operator {operator}")
+    return False
+
+def create_vector_store(backend=None):
+    """
+    Create the vector store selected by the VECTOR_STORE environment variable.
+
+    Args:
+        backend: "pinecone" (default) or "numpy"; overrides VECTOR_STORE
+
+    Returns:
+        VectorStore: The configured store
+    """
+    backend = (backend or os.getenv("VECTOR_STORE", "pinecone")).lower()
+    if backend == "numpy":
+        return NumpyVectorStore()
+    if backend == "pinecone":
+        return PineconeVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")